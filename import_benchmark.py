@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Guards lobo's cold start: imports each entry module in fresh interpreters and fails when the import takes longer than
+the budget, pulls in a driver's third-party client or config parser, or spawns a process.
+
+    python import_benchmark.py [--budget MS] [--runs N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ['lobo', 'lobo.version_tool', 'lobo.git_tool', 'lobo.daemon',
+           'lobo.issue_tracker.issue_tracker_tool', 'lobo.code_review.cr_tool',
+           'lobo.builder.builder_tool', 'lobo.instant_messaging.im_tool']
+
+# only a command that needs them may load these
+DEFERRED = ['jira', 'gitlab', 'jenkinsapi', 'hypchat', 'requests', 'dateutil', 'yaml', 'py2chainmap',
+            'lobo.issue_tracker.jira_tool', 'lobo.code_review.gitlab_tool', 'lobo.builder.jenkins_tool',
+            'lobo.instant_messaging.hipchat_tool', 'lobo.lobo']
+
+PROBE = """
+import json, subprocess, sys, time
+spawned = []
+Popen = subprocess.Popen
+def record(self, args, *a, **kw):
+    spawned.append(args)
+    Popen.__init__(self, args, *a, **kw)
+subprocess.Popen = type('Popen', (Popen,), {'__init__': record})
+started = time.time()
+__import__(%r)
+duration = time.time() - started
+print json.dumps({'duration': duration, 'modules': [m for m, v in sys.modules.items() if v is not None],
+                  'spawned': spawned})
+"""
+
+
+def probe(module):
+    p = subprocess.Popen([sys.executable, '-c', PROBE % module], cwd=ROOT, stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    if p.returncode != 0:
+        raise RuntimeError("importing %s failed:\n%s" % (module, err))
+    return json.loads(out.splitlines()[-1])
+
+
+def benchmark(module, runs, budget):
+    results = [probe(module) for _ in range(runs)]
+    best = min(r['duration'] for r in results) * 1000
+    problems = []
+    if best > budget:
+        problems.append("took %.1fms, the budget is %.1fms" % (best, budget))
+    loaded = set(results[0]['modules'])
+    for name in DEFERRED:
+        if name in loaded:
+            problems.append("loaded %s" % name)
+    for argv in results[0]['spawned']:
+        problems.append("spawned %s" % ' '.join(argv if isinstance(argv, list) else [argv]))
+    return best, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--budget', type=float, default=50, help="milliseconds an import may take")
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per module, the best run counts")
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        best, problems = benchmark(module, args.runs, args.budget)
+        print "%-40s %6.1fms %s" % (module, best, 'FAIL: ' + ', '.join(problems) if problems else 'ok')
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,48 @@
-import modules
-
-from issue_tracker.issue_tracker_tool import tool_entry as issue_tracker_tool_entry
-from code_review.cr_tool import tool_entry as cr_tool_entry
-from builder.builder_tool import tool_entry as builder_tool_entry
-from instant_messaging.im_tool import tool_entry as im_tool_entry
-from git_tool import git_tool_entry
-from version_tool import version_tool_entry
-from lobo import lobo_entry
+"""
+The console script entries. Each imports its tool only when it's run, so `import lobo` costs next to nothing
+"""
+
+
+def issue_tracker_tool_entry():
+    from issue_tracker.issue_tracker_tool import tool_entry
+    tool_entry()
+
+
+def cr_tool_entry():
+    from code_review.cr_tool import tool_entry
+    tool_entry()
+
+
+def builder_tool_entry():
+    from builder.builder_tool import tool_entry
+    tool_entry()
+
+
+def im_tool_entry():
+    from instant_messaging.im_tool import tool_entry
+    tool_entry()
+
+
+def git_tool_entry():
+    from git_tool import git_tool_entry as entry
+    entry()
+
+
+def version_tool_entry():
+    from version_tool import version_tool_entry as entry
+    entry()
+
+
+def lobo_entry():
+    from lobo import lobo_entry as entry
+    entry()
+
+
+def daemon_entry():
+    from daemon import daemon_entry as entry
+    entry()
+
+
+def lobo_client_entry():
+    from daemon import lobo_client_entry as entry
+    entry()
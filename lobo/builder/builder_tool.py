@@ -1,18 +1,23 @@
-from lobo import configuration, nop_driver
+from lobo import command_registry, configuration, nop_driver
+from lobo.lazy_driver import LazyDriver, LazyCommand
+from lobo.toolkit_base import ToolkitBase
 
-cr_tool = configuration.get_config('driver:builder')
-if cr_tool == 'jenkins':
-    import jenkins_tool as builder_driver
-else:
-    builder_driver = nop_driver.NopDriver()
+
+def load_driver():
+    if configuration.get_config('driver:builder') == 'jenkins':
+        import jenkins_tool
+        return jenkins_tool
+    return nop_driver.NopDriver()
+
+builder_driver = LazyDriver(load_driver)
 
 
 def tool_entry():
-    parser = ToolkitBase([builder_driver.RunBuild, builder_driver.TestConnection])
+    parser = ToolkitBase(command_registry.BUILDER)
     parser.parse()
 
-run_build = builder_driver.RunBuild()
-test_connection = builder_driver.TestConnection()
+run_build = LazyCommand(builder_driver, 'RunBuild')
+test_connection = LazyCommand(builder_driver, 'TestConnection')
 
 if __name__ == "__main__":
     tool_entry()
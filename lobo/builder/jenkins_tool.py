@@ -59,7 +59,6 @@ def get_instance():
 
 
 class RunBuild(object):
-    METHOD = "run-build"
     DOC = "Builds the Product"
 
     @classmethod
@@ -104,7 +103,6 @@ class RunBuild(object):
 
 
 class TestConnection(object):
-    METHOD = "test-connection"
     DOC = "Test the jenkins server connection"
 
     @classmethod
@@ -1,14 +1,18 @@
-from lobo import configuration, nop_driver
+from lobo import command_registry, configuration, nop_driver
+from lobo.lazy_driver import LazyDriver, LazyCommand
+from lobo.toolkit_base import ToolkitBase
 
-cr_tool = configuration.get_config('driver:cr')
-if cr_tool == 'gitlab':
-    import gitlab_tool as cr_driver
-else:
-    cr_driver = nop_driver.NopDriver()
+
+def load_driver():
+    if configuration.get_config('driver:cr') == 'gitlab':
+        import gitlab_tool
+        return gitlab_tool
+    return nop_driver.NopDriver()
+
+cr_driver = LazyDriver(load_driver)
 
 
 class SignedCommentMR(object):
-    METHOD = 'signed-comment-mr'
     DOC = 'Add a signed comment to an mr'
 
     @classmethod
@@ -46,31 +50,26 @@ class ApproveBase(object):
 
 
 class ApproveQA(ApproveBase):
-    METHOD = 'approve-qa'
     DOC = 'Mark an MR as QA approved'
     WHAT = 'QA'
 
 
 class ApproveCR(ApproveBase):
-    METHOD = 'approve-cr'
     DOC = 'Mark an MR as Code Reviewed'
     WHAT = 'CODE REVIEW'
 
 
 class ApproveUITests(ApproveBase):
-    METHOD = 'approve-ui-tests'
     DOC = 'Mark an MR passed UI tests'
     WHAT = 'UI TESTS'
 
 
 class ApproveProbeTests(ApproveBase):
-    METHOD = 'approve-probe-tests'
     DOC = 'Mark an MR passed probe tests'
     WHAT = 'PROBE TESTS'
 
 
 class ApproveBuild(ApproveBase):
-    METHOD = 'approve-build'
     DOC = 'Mark an MR passed build & unit tests'
     WHAT = 'BUILD'
 
@@ -79,7 +78,6 @@ class ApproveBuild(ApproveBase):
 
 
 class GetApprovals(object):
-    METHOD = 'get-approvals'
     DOC = 'Return a list of all approvals on an MR'
 
     @classmethod
@@ -118,12 +116,12 @@ class GetApprovals(object):
                 except Exception, e:
                     pass
 
-add_comment_to_mr = cr_driver.CommentMR()
-create_mr = cr_driver.CreateMR()
-close_mr = cr_driver.CloseMR()
-get_file = cr_driver.GetFile()
-protect_branch = cr_driver.ProtectBranch()
-test_connection = cr_driver.TestConnection()
+add_comment_to_mr = LazyCommand(cr_driver, 'CommentMR')
+create_mr = LazyCommand(cr_driver, 'CreateMR')
+close_mr = LazyCommand(cr_driver, 'CloseMR')
+get_file = LazyCommand(cr_driver, 'GetFile')
+protect_branch = LazyCommand(cr_driver, 'ProtectBranch')
+test_connection = LazyCommand(cr_driver, 'TestConnection')
 
 add_signed_comment_to_mr = SignedCommentMR()
 approve_qa = ApproveQA()
@@ -134,10 +132,7 @@ approve_build = ApproveBuild()
 get_signed_comments = GetApprovals()
 
 def tool_entry():
-    parser = ToolkitBase(
-        [cr_driver.CommentMR, cr_driver.CreateMR, cr_driver.etFile, cr_driver.CloseMR, cr_driver.ProtectBranch, cr_driver.TestConnection,
-         SignedCommentMR, ApproveQA, ApproveCR, ApproveUITests, ApproveProbeTests, GetApprovals,
-        ])
+    parser = ToolkitBase(command_registry.CR)
     parser.parse()
 
 if __name__ == "__main__":
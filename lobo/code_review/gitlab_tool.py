@@ -101,7 +101,6 @@ def actually_update_mr(project, mr, source_branch, target_branch, title, assigne
 
 
 class CommentMR(object):
-    METHOD = 'comment-mr'
     DOC = 'Add a comment to an mr'
 
     @classmethod
@@ -125,7 +124,6 @@ class CommentMR(object):
         return None
 
 class CreateMR(object):
-    METHOD = "create-mr"
     DOC = "Creates a new MR (in case it doesn't already exist)"
 
     @classmethod
@@ -155,7 +153,6 @@ class CreateMR(object):
 
 
 class GetFile(object):
-    METHOD = "get-file"
     DOC = "Read a file from a repository"
 
     @classmethod
@@ -189,7 +186,6 @@ def set_file(repo, ref, full_path, contents, message):
 
 
 class CloseMR(object):
-    METHOD = "close-mr"
     DOC = "Closes a merge request"
 
     @classmethod
@@ -208,7 +204,6 @@ class CloseMR(object):
 
 
 class ProtectBranch(object):
-    METHOD = "protect-branch"
     DOC = "Mark a branch in a repo as protected"
 
     @classmethod
@@ -227,7 +222,6 @@ class ProtectBranch(object):
 
 
 class TestConnection(object):
-    METHOD = "test-connection"
     DOC = "Test the GitLab credentials"
 
     @classmethod
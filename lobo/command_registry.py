@@ -0,0 +1,114 @@
+"""
+The commands of each lobo tool by name, and where to import them from ('module:attribute').
+This is the only place command names are given, the classes only carry their DOC and arguments.
+ToolkitBase only imports and sets up the command that's run, so adding commands doesn't slow the others down
+"""
+
+LOBO = [
+    ('work-on', 'lobo.lobo:WorkOn'),
+    ('new-feature', 'lobo.lobo:NewFeature'),
+    ('commit', 'lobo.lobo:Commit'),
+    ('daily', 'lobo.lobo:Daily'),
+    ('submit', 'lobo.lobo:Submit'),
+    ('pre-land', 'lobo.lobo:PreLand'),
+    ('land', 'lobo.lobo:Land'),
+    ('backout', 'lobo.lobo:Backout'),
+    ('freeze', 'lobo.lobo:Freeze'),
+    ('approve-cr', 'lobo.lobo:ApproveCR'),
+    ('approve-qa', 'lobo.lobo:ApproveQA'),
+    ('cherry-pick', 'lobo.lobo:CherryPick'),
+    ('test', 'lobo.lobo:Test'),
+    ('info', 'lobo.lobo:Info'),
+    ('reopen', 'lobo.lobo:Reopen'),
+    ('reject-cr', 'lobo.lobo:RejectCR'),
+    ('check-config', 'lobo.lobo:CheckConfig'),
+    ('update', 'lobo.lobo:Update'),
+    ('approve-ui-tests', 'lobo.lobo:ApproveUITests'),
+    ('sync', 'lobo.lobo:Sync'),
+    ('release', 'lobo.lobo:Release'),
+    ('show-open-issues', 'lobo.lobo:ShowOpenIssues'),
+    ('post-build-pre-land', 'lobo.lobo:PostBuildForPreLand'),
+    ('post-build-submit', 'lobo.lobo:PostBuildForSubmit'),
+    ('setenv', 'lobo.configuration:SetEnv'),
+    ('config', 'lobo.configuration:Config'),
+    ('get-config', 'lobo.configuration:GetConfig'),
+    ('update-qa', 'lobo.lobo:UpdateQA'),
+    ('abort', 'lobo.lobo:Abort'),
+    ('notify-bugs', 'lobo.lobo:NotifyBugs'),
+]
+
+GIT = [
+    ('tree-root', 'lobo.git_tool:TreeRoot'),
+    ('compare-branches', 'lobo.git_tool:CompareBranches'),
+    ('recurse-submodules', 'lobo.git_tool:RecurseSubmodules'),
+    ('get-remote', 'lobo.git_tool:GetRemote'),
+    ('new-branch', 'lobo.git_tool:NewBranch'),
+    ('checkout-remote', 'lobo.git_tool:CheckoutRemote'),
+    ('get-current-branch', 'lobo.git_tool:GetCurrentBranch'),
+    ('rebase-if-needed', 'lobo.git_tool:RebaseIfNeeded'),
+    ('squash', 'lobo.git_tool:Squash'),
+    ('push', 'lobo.git_tool:Push'),
+    ('fix-refs', 'lobo.git_tool:FixRefs'),
+    ('get-repo', 'lobo.git_tool:GetRepo'),
+    ('tag', 'lobo.git_tool:Tag'),
+    ('cleanup', 'lobo.git_tool:Cleanup'),
+]
+
+VERSION = [
+    ('c2n', 'lobo.version_tool:CalcVersionName'),
+    ('n2c', 'lobo.version_tool:CalcVersionCode'),
+]
+
+DAEMON = [
+    ('start', 'lobo.daemon:Start'),
+    ('run', 'lobo.daemon:Run'),
+    ('stop', 'lobo.daemon:Stop'),
+    ('status', 'lobo.daemon:Status'),
+]
+
+# the driver's commands, picked by the configuration
+ISSUE_TRACKER = [
+    ('test-connection', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.TestConnection'),
+    ('new-issue', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.NewIssue'),
+    ('comment-issue', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.CommentIssue'),
+    ('search', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.Search'),
+    ('start-progress', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.StartProgress'),
+    ('stop-progress', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.StopProgress'),
+    ('resolve-issue', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.ResolveIssue'),
+    ('request-cr', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.SendToCR'),
+    ('start-testing', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.SendToQA'),
+    ('land', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.LandIssue'),
+    ('in-rc', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.MarkInRC'),
+    ('reopen', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.Reopen'),
+    ('reject', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.Reject'),
+    ('abort-issue', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.AbortIssue'),
+    ('get-in-rc', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.GetInRC'),
+    ('get_open_issues', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.GetOpenIssues'),
+    ('get_issues_to_review', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.GetIssuesToReview'),
+    ('get_blocker_bugs_to_do', 'lobo.issue_tracker.issue_tracker_tool:issue_tracker_driver.GetBlockerBugsToDo'),
+]
+
+CR = [
+    ('comment-mr', 'lobo.code_review.cr_tool:cr_driver.CommentMR'),
+    ('create-mr', 'lobo.code_review.cr_tool:cr_driver.CreateMR'),
+    ('get-file', 'lobo.code_review.cr_tool:cr_driver.GetFile'),
+    ('close-mr', 'lobo.code_review.cr_tool:cr_driver.CloseMR'),
+    ('protect-branch', 'lobo.code_review.cr_tool:cr_driver.ProtectBranch'),
+    ('test-connection', 'lobo.code_review.cr_tool:cr_driver.TestConnection'),
+    ('signed-comment-mr', 'lobo.code_review.cr_tool:SignedCommentMR'),
+    ('approve-qa', 'lobo.code_review.cr_tool:ApproveQA'),
+    ('approve-cr', 'lobo.code_review.cr_tool:ApproveCR'),
+    ('approve-ui-tests', 'lobo.code_review.cr_tool:ApproveUITests'),
+    ('approve-probe-tests', 'lobo.code_review.cr_tool:ApproveProbeTests'),
+    ('get-approvals', 'lobo.code_review.cr_tool:GetApprovals'),
+]
+
+BUILDER = [
+    ('run-build', 'lobo.builder.builder_tool:builder_driver.RunBuild'),
+    ('test-connection', 'lobo.builder.builder_tool:builder_driver.TestConnection'),
+]
+
+IM = [
+    ('test-connection', 'lobo.instant_messaging.im_tool:im_driver.TestConnection'),
+    ('send-message', 'lobo.instant_messaging.im_tool:im_driver.SendMessage'),
+]
@@ -1,8 +1,10 @@
+import hashlib
+import marshal
 import os
 import pprint
-from py2chainmap import ChainMap
 import sys
-import yaml
+import tempfile
+from common import TEMP_DIR
 from logger import logger
 
 
@@ -13,9 +15,11 @@ DEFAULT_ENV = 'default'
 
 combined_config = None
 
+# the parsed configuration, so only a changed config file is parsed again
+SNAPSHOT_VERSION = 1
+
 
 class GetConfig(object):
-    METHOD = 'get-config'
     DOC = 'Get a lobo configuration item'
 
     @classmethod
@@ -28,31 +32,10 @@ class GetConfig(object):
     def __call__(self, key):
         global combined_config
         if not combined_config:
-            local_config = load_config(False)
-
-            if local_config:
-                if local_config.has_key(DEFAULT_ENV):
-                    default_local_config = local_config[DEFAULT_ENV]
-                else:
-                    default_local_config = dict()
-                if local_config.has_key(local_config[ENV]):
-                    env_local_config = local_config[local_config[ENV]]
-                else:
-                    env_local_config = dict()
-            else:
-                default_local_config = dict()
-                env_local_config = dict()
-
-            global_config = load_config(True)
-
-            if global_config:
-                default_global_config = global_config[DEFAULT_ENV]
-                env_global_config = global_config[global_config[ENV]]
-            else:
+            combined_config = load_combined_config()
+            if combined_config is None:
                 return None
 
-            combined_config = ChainMap(env_local_config, default_local_config, env_global_config, default_global_config)
-
         key_splits = str.split(key, '.')
         value = None
         endpoint = combined_config.get(key_splits[0])
@@ -63,7 +46,6 @@ class GetConfig(object):
 
 
 class Config(object):
-    METHOD = 'config'
     DOC = 'set a configuration parameter'
 
     @classmethod
@@ -87,7 +69,6 @@ class Config(object):
 
 
 class SetEnv(object):
-    METHOD = 'setenv'
     DOC = 'Set lobo environemnt (for multiple endpoint configurations)'
 
     @classmethod
@@ -132,6 +113,7 @@ def get_config_file_path(isglobal):
 
 
 def load_config(isglobal):
+    import yaml
     try:
         with open(get_config_file_path(isglobal), 'r') as stream:
             config = yaml.load(stream)
@@ -145,11 +127,104 @@ def load_config(isglobal):
 
 
 def dump_config(config, isglobal):
+    global combined_config
+    import yaml
     with open(get_config_file_path(isglobal), 'w') as stream:
         ret = stream.write(yaml.dump(config))
+    combined_config = None
     return ret
 
 
+def parse_config():
+    """
+    :return: the configurations get_config looks in, by precedence. None without a global config
+    """
+    local_config = load_config(False)
+
+    if local_config:
+        if local_config.has_key(DEFAULT_ENV):
+            default_local_config = local_config[DEFAULT_ENV]
+        else:
+            default_local_config = dict()
+        if local_config.has_key(local_config[ENV]):
+            env_local_config = local_config[local_config[ENV]]
+        else:
+            env_local_config = dict()
+    else:
+        default_local_config = dict()
+        env_local_config = dict()
+
+    global_config = load_config(True)
+
+    if global_config:
+        default_global_config = global_config[DEFAULT_ENV]
+        env_global_config = global_config[global_config[ENV]]
+    else:
+        return None
+
+    return [env_local_config, default_local_config, env_global_config, default_global_config]
+
+
+def config_stamps():
+    stamps = []
+    for isglobal in [False, True]:
+        filename = os.path.abspath(get_config_file_path(isglobal))
+        try:
+            st = os.stat(filename)
+            stamps.append([filename, st.st_mtime, st.st_size])
+        except OSError:
+            stamps.append([filename, None, None])
+    return stamps
+
+
+def snapshot_file():
+    key = hashlib.md5(os.path.abspath(get_config_file_path(False))).hexdigest()[:8]
+    return os.path.join(TEMP_DIR, 'lobo-config-%d-%s.marshal' % (os.getuid(), key))
+
+
+def load_snapshot(stamps):
+    try:
+        with open(snapshot_file(), 'rb') as f:
+            if os.fstat(f.fileno()).st_uid != os.getuid():
+                return None
+            snapshot = marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION \
+            or snapshot.get('stamps') != stamps:
+        return None
+    return snapshot
+
+
+def save_snapshot(stamps, maps):
+    try:
+        data = marshal.dumps({'version': SNAPSHOT_VERSION, 'stamps': stamps, 'maps': maps})
+    except ValueError:
+        return  # yaml gave us something marshal can't store, e.g. a date
+    filename = snapshot_file()
+    try:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=os.path.basename(filename))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, filename)
+    except (IOError, OSError):
+        pass
+
+
+def load_combined_config():
+    stamps = config_stamps()
+    snapshot = load_snapshot(stamps)
+    if snapshot is not None:
+        maps = snapshot['maps']
+    else:
+        maps = parse_config()
+        save_snapshot(stamps, maps)
+    if maps is None:
+        return None
+    from py2chainmap import ChainMap
+    return ChainMap(*maps)
+
+
 def handle_missing_config(message, config_key, value_pattern='value'):
     logger.error(message)
     logger.error('\tlobo config --global {} {}'.format(config_key, value_pattern))
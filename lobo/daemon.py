@@ -0,0 +1,489 @@
+import atexit
+import errno
+import gc
+import hashlib
+import json
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import traceback
+
+from common import TEMP_DIR
+
+"""
+An optional lobo daemon, one per user and project, serving lobo commands on a Unix socket.
+It imports lobo and sets up the issue tracker, code review, builder and IM clients once. Each command then runs in a
+fork of it, with the client's arguments, environment and stdin, its output streamed back as it's written.
+`lobo-daemon start` in the project root starts it, from then on `lobo` forwards its commands to it.
+The daemon restarts itself when the configuration changes, LOBO_DAEMON=0 bypasses it
+"""
+
+DAEMON_ENV = 'LOBO_DAEMON'
+
+# frames: a kind and the length of the data that follows
+HEADER = struct.Struct('!cI')
+REQUEST, STDIN, STDOUT, STDERR, EXIT, DECLINED = 'r', 'i', 'o', 'e', 'x', 'd'
+CHUNK_SIZE = 64 * 1024
+
+
+def socket_file(root):
+    key = hashlib.md5(os.path.abspath(root)).hexdigest()[:8]
+    return os.path.join(TEMP_DIR, 'lobo-%d-%s.sock' % (os.getuid(), key))
+
+
+def pid_file(root):
+    return socket_file(root) + '.pid'
+
+
+def peer_uid(conn):
+    """
+    :return: the uid of the process on the other side of a Unix socket, None where the platform can't tell
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            # SO_PEERCRED: struct ucred {pid, uid, gid}
+            cred = conn.getsockopt(socket.SOL_SOCKET, getattr(socket, 'SO_PEERCRED', 17), struct.calcsize('3i'))
+            return struct.unpack('3i', cred)[1]
+        if sys.platform == 'darwin':
+            # SOL_LOCAL, LOCAL_PEERCRED: struct xucred {version, uid, ...}
+            cred = conn.getsockopt(0, 1, 76)
+            return struct.unpack('2I', cred[:8])[1]
+    except socket.error:
+        pass
+    return None
+
+
+def send_frame(sock, kind, data=''):
+    sock.sendall(HEADER.pack(kind, len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    data = ''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_frame(sock):
+    """
+    :return: (kind, data), or (None, None) once the other side is gone
+    """
+    header = recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None, None
+    kind, size = HEADER.unpack(header)
+    data = recv_exactly(sock, size) if size > 0 else ''
+    if data is None:
+        return None, None
+    return kind, data
+
+
+def config_stamps(root):
+    """
+    The daemon only serves commands while the configuration it was warmed with is current
+    """
+    stamps = []
+    for filename in [os.path.expanduser('~/.loboconfig'), os.path.join(root, '.loboconfig'),
+                     os.path.join(root, '.lobomodules')]:
+        try:
+            st = os.stat(filename)
+            stamps.append([st.st_mtime, st.st_size])
+        except OSError:
+            stamps.append(None)
+    return stamps
+
+
+def forward(argv):
+    """
+    Run a lobo command on the daemon of the current directory
+    :return: the command's exit code, None if there's no daemon to run it
+    """
+    if os.environ.get(DAEMON_ENV) == '0':
+        return None
+    path = socket_file(os.getcwd())
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        send_frame(sock, REQUEST, json.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}))
+    except socket.error:
+        sock.close()
+        return None
+
+    def forward_stdin():
+        try:
+            while True:
+                data = os.read(sys.stdin.fileno(), CHUNK_SIZE)
+                send_frame(sock, STDIN, data)
+                if not data:
+                    return
+        except (OSError, socket.error):
+            pass
+
+    stdin_thread = threading.Thread(target=forward_stdin, name='lobo-stdin')
+    stdin_thread.daemon = True
+    stdin_thread.start()
+    try:
+        while True:
+            kind, data = recv_frame(sock)
+            if kind == STDOUT:
+                sys.stdout.write(data)
+                sys.stdout.flush()
+            elif kind == STDERR:
+                sys.stderr.write(data)
+                sys.stderr.flush()
+            elif kind == EXIT:
+                return int(data)
+            elif kind == DECLINED:
+                return None
+            else:
+                print >> sys.stderr, "lost the lobo daemon"
+                return 1
+    except KeyboardInterrupt:
+        # the daemon interrupts the command once we hang up
+        return 130
+    finally:
+        sock.close()
+
+
+class Daemon(object):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.socket_file = socket_file(self.root)
+        self.listener = None
+        self.stamps = None
+        self.pid = None
+        self.handlers = []
+        self.restart_requested = threading.Event()
+
+    def warm(self):
+        """
+        Import lobo and connect the clients of the configured drivers, so commands don't have to
+        """
+        import configuration
+        import lobo
+        from issue_tracker import issue_tracker_tool
+        from code_review import cr_tool
+        from builder import builder_tool
+        from instant_messaging import im_tool
+
+        self.stamps = config_stamps(self.root)
+        configuration.get_config('driver:issue_tracker')
+        for driver, getter in [(issue_tracker_tool.issue_tracker_driver, 'get_jira_server'),
+                               (cr_tool.cr_driver, 'get_instance'),
+                               (builder_tool.builder_driver, 'get_instance'),
+                               (im_tool.im_driver, 'get_instance')]:
+            try:
+                getattr(driver, getter)()
+            except (Exception, SystemExit) as e:
+                print "couldn't warm up %s: %s" % (getattr(driver, '__name__', driver), e)
+        self.close_connections()
+        return lobo.lobo_entry
+
+    @staticmethod
+    def close_connections():
+        """
+        Forked commands must not share the sockets of the warm clients, each opens its own connections
+        """
+        try:
+            import requests
+        except ImportError:
+            return
+        for obj in gc.get_objects():
+            if isinstance(obj, requests.Session):
+                obj.close()
+
+    def serve(self):
+        os.chdir(self.root)
+        entry = self.warm()
+        if os.path.exists(self.socket_file):
+            os.unlink(self.socket_file)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # created private, other users must never be able to connect, not even before a chmod
+        umask = os.umask(0077)
+        try:
+            self.listener.bind(self.socket_file)
+        finally:
+            os.umask(umask)
+        self.listener.listen(16)
+        self.pid = os.getpid()
+        with open(pid_file(self.root), 'w') as f:
+            f.write(str(self.pid))
+        atexit.register(self.cleanup)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        print "lobo daemon serving %s on %s" % (self.root, self.socket_file)
+        while not self.restart_requested.is_set():
+            readable, _, _ = select.select([self.listener], [], [], 1)
+            if not readable:
+                continue
+            conn, _ = self.listener.accept()
+            handler = threading.Thread(target=self.handle, args=(conn, entry), name='lobo-command')
+            handler.daemon = True
+            handler.start()
+            self.handlers = [h for h in self.handlers if h.is_alive()] + [handler]
+        self.restart()
+
+    def cleanup(self):
+        # forked commands inherit this atexit handler, only the daemon itself may remove its files
+        if os.getpid() != self.pid:
+            return
+        for filename in [self.socket_file, pid_file(self.root)]:
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+
+    def decline_pending(self):
+        """
+        Turn away the clients that connected but weren't accepted yet, they run their commands themselves
+        """
+        self.listener.setblocking(False)
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            conn.setblocking(True)
+            send_frame(conn, DECLINED)
+            conn.close()
+
+    def restart(self):
+        """
+        Stop taking commands, let the running ones finish, then start over with the new configuration
+        """
+        print "configuration changed, restarting once the running commands are done"
+        sys.stdout.flush()
+        try:
+            os.unlink(self.socket_file)
+        except OSError:
+            pass
+        self.decline_pending()
+        self.listener.close()
+        for handler in self.handlers:
+            handler.join()
+        self.cleanup()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def handle(self, conn, entry):
+        if peer_uid(conn) != os.getuid():
+            # commands run as the daemon's owner, only the owner may ask for them
+            conn.close()
+            return
+        kind, data = recv_frame(conn)
+        if kind != REQUEST:
+            conn.close()
+            return
+        if self.restart_requested.is_set() or config_stamps(self.root) != self.stamps:
+            send_frame(conn, DECLINED)
+            conn.close()
+            self.restart_requested.set()
+            return
+        # json hands back unicode, the command gets plain strings like it would from the shell
+        request = json.loads(data, object_hook=lambda d: dict((str(k), v) for k, v in d.iteritems()))
+        request['argv'] = [arg.encode('utf-8') for arg in request['argv']]
+        request['cwd'] = request['cwd'].encode('utf-8')
+        request['env'] = dict((k, v.encode('utf-8')) for k, v in request['env'].iteritems())
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            self.listener.close()
+            conn.close()
+            for fd, target in [(stdin_r, 0), (stdout_w, 1), (stderr_w, 2)]:
+                os.dup2(fd, target)
+            for fd in [stdin_r, stdin_w, stdout_r, stdout_w, stderr_r, stderr_w]:
+                os.close(fd)
+            run_command(request, entry)
+        for fd in [stdin_r, stdout_w, stderr_w]:
+            os.close(fd)
+        self.relay(conn, pid, stdin_w, {stdout_r: STDOUT, stderr_r: STDERR})
+
+    def relay(self, conn, pid, stdin_w, outputs):
+        try:
+            while outputs:
+                readable, _, _ = select.select([conn] + outputs.keys(), [], [])
+                for fd in readable:
+                    if fd is conn:
+                        kind, data = recv_frame(conn)
+                        if kind is None:
+                            # the client is gone (e.g. ^C)
+                            os.kill(pid, signal.SIGINT)
+                            return
+                        if stdin_w is not None:
+                            if data:
+                                os.write(stdin_w, data)
+                            else:
+                                os.close(stdin_w)
+                                stdin_w = None
+                        continue
+                    data = os.read(fd, CHUNK_SIZE)
+                    if data:
+                        send_frame(conn, outputs[fd], data)
+                    else:
+                        os.close(fd)
+                        del outputs[fd]
+            _, status = os.waitpid(pid, 0)
+            send_frame(conn, EXIT, str(os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1))
+        except (OSError, socket.error):
+            pass
+        finally:
+            if stdin_w is not None:
+                os.close(stdin_w)
+            for fd in outputs:
+                os.close(fd)
+            conn.close()
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+
+def run_command(request, entry):
+    """
+    The forked side of a command: become the client's process and run it. Never returns
+    """
+    import journal
+    code = 0
+    try:
+        os.chdir(request['cwd'])
+        journal.START_DIR = request['cwd']
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = request['argv']
+        sys.stdin = os.fdopen(0, 'r')
+        sys.stdout = os.fdopen(1, 'w', 0)
+        sys.stderr = os.fdopen(2, 'w', 0)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        journal.journal.after_fork()
+        import modules
+        modules.modules = None
+        entry()
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print >> sys.stderr, e.code
+            code = 1
+    except KeyboardInterrupt:
+        code = 130
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    try:
+        atexit._run_exitfuncs()
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        os._exit(code)
+
+
+def running_pid(root):
+    try:
+        with open(pid_file(root)) as f:
+            pid = int(f.read())
+        os.kill(pid, 0)
+        return pid
+    except (IOError, OSError, ValueError):
+        return None
+
+
+class Start(object):
+    DOC = 'Start the lobo daemon of this project in the background'
+
+    @classmethod
+    def setup_argparser(cls, parser):
+        pass
+
+    def handle(self, namespace):
+        self()
+
+    def __call__(self):
+        pid = running_pid(os.getcwd())
+        if pid is not None:
+            print "lobo daemon is already running (pid %d)" % pid
+            return
+        log = open(os.path.join(TEMP_DIR, 'lobo-daemon-%d.log' % os.getuid()), 'a')
+        subprocess.Popen([sys.executable, sys.argv[0], 'run'], stdin=open(os.devnull), stdout=log, stderr=log,
+                         preexec_fn=os.setsid, close_fds=True)
+        print "lobo daemon started, its log is at %s" % log.name
+
+
+class Run(object):
+    DOC = 'Run the lobo daemon of this project in the foreground'
+
+    @classmethod
+    def setup_argparser(cls, parser):
+        pass
+
+    def handle(self, namespace):
+        self()
+
+    def __call__(self):
+        Daemon(os.getcwd()).serve()
+
+
+class Stop(object):
+    DOC = 'Stop the lobo daemon of this project'
+
+    @classmethod
+    def setup_argparser(cls, parser):
+        pass
+
+    def handle(self, namespace):
+        self()
+
+    def __call__(self):
+        pid = running_pid(os.getcwd())
+        if pid is None:
+            print "lobo daemon isn't running"
+            return
+        os.kill(pid, signal.SIGTERM)
+        print "lobo daemon stopped"
+
+
+class Status(object):
+    DOC = 'Is the lobo daemon of this project running?'
+
+    @classmethod
+    def setup_argparser(cls, parser):
+        pass
+
+    def handle(self, namespace):
+        pid = running_pid(os.getcwd())
+        if pid is None:
+            print "lobo daemon isn't running"
+        else:
+            print "lobo daemon is running (pid %d) on %s" % (pid, socket_file(os.getcwd()))
+
+
+def daemon_entry():
+    import command_registry
+    from toolkit_base import ToolkitBase
+    parser = ToolkitBase(command_registry.DAEMON)
+    parser.parse()
+
+
+def lobo_client_entry():
+    """
+    The `lobo` command: forward to the daemon when there's one, run in process otherwise
+    """
+    code = forward(sys.argv)
+    if code is not None:
+        sys.exit(code)
+    from lobo import lobo_entry
+    lobo_entry()
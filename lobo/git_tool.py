@@ -1,55 +1,122 @@
+import atexit
 import datetime
+import errno
+import fcntl
+import json
 import os
+import re
+import shutil
 import subprocess
+import tempfile
 from multiprocessing.pool import ThreadPool
+import threading
+import time
+import Queue
 import sys
 import warnings
+import command_registry
 import modules
-from common import cd, TEMP_DIR, RED, BOLD, UNDERLINE, printp, FILLER
+from common import cd, RED, BOLD, UNDERLINE, printp, FILLER
 import configuration
+from journal import journal, relative_submodule
+from tracing import span
 
 from toolkit_base import ToolkitBase
-from collections import namedtuple
+from collections import namedtuple, Counter, defaultdict
+from contextlib import contextmanager
 
-try:
-    subprocess.Popen(['git'], stdout=subprocess.PIPE)
-except OSError as e:
-    print RED('FATAL: git not found in path, exiting.')
-    exit(1)
-
-log_file = os.path.join(TEMP_DIR, 'lobo.log')
-out = file(log_file, "w")
+print_lock = threading.Lock()
 
 giterr = None
-verbose = False
+# read from the configuration by the first git command
+verbose = None
 
+DEFAULT_WORKERS = 4
 
-def gitcmd(command, cwd='.', git=True):
-    global giterr
+# submodule tasks running on a worker thread can't chdir (the cwd is process wide), so each thread keeps its own
+thread_state = threading.local()
+
+
+def work_dir():
+    """
+    :return: the directory git commands of the current thread run in by default
+    """
+    return getattr(thread_state, 'cwd', '.')
+
+
+@contextmanager
+def work_in(path):
+    """
+    Like common.cd, but only for the calling thread: gitcmd (and anything built on it) will run in path
+    """
+    old_dir = work_dir()
+    thread_state.cwd = path
+    try:
+        yield
+    finally:
+        thread_state.cwd = old_dir
+
+
+def is_verbose():
     global verbose
+    if verbose is None:
+        verbose = configuration.get_config('git-tool.verbose')
+    return verbose
+
+
+def get_workers():
+    return int(configuration.get_config_or_default('git-tool.workers', DEFAULT_WORKERS))
 
+
+def command_parts(command, git=True):
     if type(command) == list:
         parts = command
     else:
         parts = command.split()
     if git:
         parts = ["git"] + parts
+    return parts
 
-    msg = ">> %s" % " ".join(parts)
-    if verbose: print msg
-    out.write("%s\n" % msg)
-    out.flush()
 
-    p = subprocess.Popen(parts, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    ret, err = p.communicate()
+def popen(parts, **kwargs):
+    """
+    git is looked for when the first command runs, not when lobo is imported
+    """
+    try:
+        return subprocess.Popen(parts, **kwargs)
+    except OSError as e:
+        if e.errno == errno.ENOENT and os.path.isdir(kwargs.get('cwd') or '.'):
+            print RED('FATAL: git not found in path, exiting.')
+            exit(1)
+        raise
+
+
+def gitcmd(command, cwd='.', git=True, env=None):
+    global giterr
+
+    parts = command_parts(command, git)
+
+    if is_verbose():
+        with print_lock:
+            print ">> %s" % " ".join(parts)
+
+    cwd = os.path.abspath(os.path.join(work_dir(), cwd))
+    submodule = relative_submodule(cwd)
+    started = time.time()
+    with span(" ".join(parts[:2]), 'git', argv=parts, submodule=submodule):
+        if env is not None:
+            env = dict(os.environ, **env)
+        p = popen(parts, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        ret, err = p.communicate()
+    journal.record(argv=parts, cwd=cwd, submodule=submodule, start=started,
+                   duration=time.time() - started, exit_code=p.returncode, output_size=len(ret) + len(err))
 
     ret = ret.rstrip()
     err = err.rstrip()
 
-    if verbose:
-        print ret + err
-    out.write(ret + err + "\n")
-    out.flush()
+    if is_verbose():
+        with print_lock:
+            print ret + err
 
     errorcode = p.returncode
     if errorcode == 0:
@@ -60,85 +127,587 @@ def gitcmd(command, cwd='.', git=True):
         return None, giterr
 
 
-GitStatus = namedtuple("GitStatus", "merge staged modified untracked conflict")
+class GitStream(object):
+    """
+    Like gitcmd, but yields the sep delimited output records as they are read instead of buffering the whole output.
+    Once exhausted, error holds what gitcmd would have returned as the error
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, command, cwd='.', sep='\0', git=True):
+        self.parts = command_parts(command, git)
+        self.cwd = os.path.abspath(os.path.join(work_dir(), cwd))
+        self.sep = sep
+        self.error = None
+
+    def __iter__(self):
+        submodule = relative_submodule(self.cwd)
+        started = time.time()
+        size = 0
+        with span(" ".join(self.parts[:2]), 'git', argv=self.parts, submodule=submodule):
+            p = popen(self.parts, cwd=self.cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            pending = ''
+            while True:
+                chunk = p.stdout.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                records = (pending + chunk).split(self.sep)
+                pending = records.pop()
+                for record in records:
+                    yield record
+            if pending:
+                yield pending
+            err = p.stderr.read()
+            p.wait()
+        journal.record(argv=self.parts, cwd=self.cwd, submodule=submodule, start=started,
+                       duration=time.time() - started, exit_code=p.returncode, output_size=size + len(err))
+        self.error = err.rstrip() if p.returncode != 0 else None
+
+
+def resolve_git_dir(path):
+    """
+    :return: the git dir of the repository checked out at path, following the gitdir file submodules use
+    """
+    git_dir = os.path.join(path, '.git')
+    if os.path.isfile(git_dir):
+        with open(git_dir) as f:
+            content = f.read().strip()
+        if content.startswith('gitdir: '):
+            return os.path.normpath(os.path.join(path, content[len('gitdir: '):]))
+    return git_dir
+
+
+git_dirs_cache = {}
+git_dirs_lock = threading.Lock()
+
+
+def get_git_dirs(path):
+    """
+    Ask git once per path, so subdirectories of a checkout, linked worktrees and GIT_DIR / GIT_COMMON_DIR all work
+    :return: (git dir, common dir), None outside of a repository
+    """
+    with git_dirs_lock:
+        if path in git_dirs_cache:
+            return git_dirs_cache[path]
+    ret, err = gitcmd(['rev-parse', '--git-dir', '--git-common-dir'], path)
+    dirs = None
+    if err is None:
+        lines = ret.splitlines()
+        if len(lines) == 2:
+            dirs = tuple(os.path.normpath(os.path.join(path, line)) for line in lines)
+    with git_dirs_lock:
+        git_dirs_cache[path] = dirs
+    return dirs
+
 
+git_version_cache = []
 
-def status():
-    ret, err = gitcmd(['status', '--porcelain', '--ignore-submodules=dirty'])
-    if ret is None:
-        print err
+
+def git_version():
+    """
+    :return: git's (major, minor), None if it can't tell
+    """
+    if not git_version_cache:
+        ret, err = gitcmd(['--version'])
+        match = re.search(r'(\d+)\.(\d+)', ret or '')
+        git_version_cache.append((int(match.group(1)), int(match.group(2))) if err is None and match else None)
+    return git_version_cache[0]
+
+
+def file_stamp(filename):
+    """
+    mtimes can be as coarse as a second, size and inode catch most rewrites within one
+    """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size, st.st_ino]
+
+
+class ObjectService(object):
+    """
+    Long lived `git cat-file` processes of a single repository, answering object and ref lookups over a pipe
+    instead of spawning a git process per question
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.processes = {}
+
+    def process(self, mode):
+        p = self.processes.get(mode)
+        if p is None:
+            p = popen(['git', 'cat-file', mode], cwd=self.path, stdin=subprocess.PIPE,
+                      stdout=subprocess.PIPE, stderr=file(os.devnull, 'w'))
+            self.processes[mode] = p
+        return p
+
+    def query(self, mode, name):
+        """
+        :return: (process, (sha, type, size)) for name, or (process, None) if it does not resolve
+        """
+        p = self.process(mode)
+        try:
+            p.stdin.write(name + '\n')
+            p.stdin.flush()
+            header = p.stdout.readline().split()
+        except IOError:
+            header = []
+        if len(header) != 3:
+            return p, None
+        return p, (header[0], header[1], int(header[2]))
+
+    def rev_parse(self, name):
+        """
+        :return: the sha name resolves to, or None
+        """
+        with self.lock:
+            _, info = self.query('--batch-check', name)
+        return info[0] if info is not None else None
+
+    def contents(self, name):
+        with self.lock:
+            p, info = self.query('--batch', name)
+            if info is None:
+                return None
+            data = p.stdout.read(info[2])
+            p.stdout.read(1)
+        return data
+
+    def author(self, name='HEAD'):
+        """
+        :return: 'name <email>' of the author of a commit
+        """
+        commit = self.contents(name)
+        if commit is None:
+            return None
+        for line in commit.split('\n'):
+            if line == '':
+                break
+            if line.startswith('author '):
+                return line[len('author '):].rsplit(' ', 2)[0]
         return None
-    ret = ret.split('\n')
-    ret = [(x[:2], x[3:]) for x in ret if len(x) >= 4]
+
+    def close(self):
+        with self.lock:
+            for p in self.processes.values():
+                try:
+                    p.stdin.close()
+                    p.wait()
+                except (IOError, OSError):
+                    pass
+            self.processes = {}
+
+
+object_services = {}
+object_services_lock = threading.Lock()
+
+
+def get_object_service():
+    """
+    :return: the ObjectService of the repository we're working in, started on first use
+    """
+    path = os.path.abspath(work_dir())
+    with object_services_lock:
+        service = object_services.get(path)
+        if service is None:
+            service = object_services[path] = ObjectService(path)
+    return service
+
+
+def close_object_services():
+    with object_services_lock:
+        for service in object_services.values():
+            service.close()
+        object_services.clear()
+
+
+atexit.register(close_object_services)
+
+
+class RefDatabase(object):
+    """
+    Reads the refs of a repository straight from packed-refs, the loose refs/ directory and HEAD.
+    Parsed refs are cached until packed-refs, HEAD or one of the refs/ directories changes
+    (git updates loose refs by renaming a lock file, which touches the containing directory)
+    """
+
+    def __init__(self, git_dir, common_dir):
+        # in a linked worktree HEAD is its own, refs are shared with the main repository
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+        self.lock = threading.Lock()
+        self.cached = None
+        self.stamps = None
+
+    def read_stamps(self):
+        stamps = {'packed-refs': file_stamp(os.path.join(self.common_dir, 'packed-refs')),
+                  'HEAD': file_stamp(os.path.join(self.git_dir, 'HEAD'))}
+        for dirpath, _, _ in os.walk(os.path.join(self.common_dir, 'refs')):
+            stamps[dirpath] = file_stamp(dirpath)
+        return stamps
+
+    def is_valid(self):
+        for filename, stamp in self.stamps.iteritems():
+            if filename == 'packed-refs':
+                filename = os.path.join(self.common_dir, filename)
+            elif filename == 'HEAD':
+                filename = os.path.join(self.git_dir, filename)
+            if file_stamp(filename) != stamp:
+                return False
+        return True
+
+    def read_refs(self):
+        refs = {}
+        try:
+            with open(os.path.join(self.common_dir, 'packed-refs')) as f:
+                for line in f:
+                    if line.startswith('#') or line.startswith('^'):
+                        continue
+                    parts = line.split()
+                    if len(parts) == 2:
+                        refs[parts[1]] = parts[0]
+        except IOError:
+            pass
+        for dirpath, _, filenames in os.walk(os.path.join(self.common_dir, 'refs')):
+            for filename in filenames:
+                if filename.endswith('.lock'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    value = file(path).read().strip()
+                except IOError:
+                    continue
+                refs[os.path.relpath(path, self.common_dir).replace(os.sep, '/')] = value
+        return refs
+
+    def refs(self):
+        """
+        :return: {refname: sha}, symbolic refs such as refs/remotes/origin/HEAD map to 'ref: <target>'
+        """
+        with self.lock:
+            if self.cached is None or not self.is_valid():
+                self.stamps = self.read_stamps()
+                self.cached = self.read_refs()
+            return self.cached
+
+    def exists(self, refname):
+        return refname in self.refs()
+
+    def names(self, prefix):
+        """
+        :return: the names of all refs under prefix, without it
+        """
+        return [refname[len(prefix):] for refname, value in self.refs().iteritems()
+                if refname.startswith(prefix) and not value.startswith('ref: ')]
+
+    def current_branch(self):
+        """
+        :return: the branch HEAD points to, or None if detached
+        """
+        try:
+            head = file(os.path.join(self.git_dir, 'HEAD')).read().strip()
+        except IOError:
+            return None
+        if not head.startswith('ref: refs/heads/'):
+            return None
+        return head[len('ref: refs/heads/'):]
+
+    def head(self):
+        """
+        :return: the commit HEAD is at, or None if there's none (unborn branch, nothing checked out)
+        """
+        try:
+            head = file(os.path.join(self.git_dir, 'HEAD')).read().strip()
+        except IOError:
+            return None
+        if head.startswith('ref: '):
+            head = self.refs().get(head[len('ref: '):])
+        if head is None or head.startswith('ref: '):
+            return None
+        return head
+
+
+ref_databases = {}
+ref_databases_lock = threading.Lock()
+
+
+def get_ref_database():
+    """
+    :return: the RefDatabase of the repository we're working in
+    """
+    path = os.path.abspath(work_dir())
+    dirs = get_git_dirs(path)
+    if dirs is None:
+        git_dir = resolve_git_dir(path)
+        dirs = git_dir, git_dir
+    with ref_databases_lock:
+        db = ref_databases.get(dirs)
+        if db is None:
+            db = ref_databases[dirs] = RefDatabase(*dirs)
+    return db
+
+
+GitStatus = namedtuple("GitStatus", "merge staged modified untracked conflict submodules")
+# state of a submodule entry, from the S<c><m><u> field of porcelain v2
+SubmoduleStatus = namedtuple("SubmoduleStatus", "commit_changed modified untracked")
+
+
+def status(untracked=False):
+    """
+    Parse `git status --porcelain=v2 -z` as git streams it.
+    :param untracked: also list untracked files, which is by far the most expensive part on large trees
+    :return: a GitStatus, where submodules maps every submodule entry to its SubmoduleStatus
+    """
+    stream = GitStream(['status', '--porcelain=v2', '-z', '--ignore-submodules=dirty',
+                        '--untracked-files=%s' % ('all' if untracked else 'no')])
     merge = False
-    untracked = []
+    untracked_files = []
     modified = []
     staged = []
     conflict = []
-    for kind, filename in ret:
-        if filename[0] == '"':
-            filename = eval(filename)
-        if kind == '??':
-            untracked.append(filename)
-        if kind[1] in ['M', 'D']:
-            modified.append(filename)
-        if kind[1] in ['M', 'D', ' '] and kind[0] in ['M', 'A', 'R', 'C', 'D']:
-            staged.append(filename)
-        if kind in ['DD', 'DU', 'AA', 'AU', 'UA', 'UD', 'UU']:
+    submodules = {}
+    records = iter(stream)
+    for record in records:
+        kind = record[:1]
+        if kind == '?':
+            untracked_files.append(record[2:])
+            continue
+        if kind not in ('1', '2', 'u'):
+            continue
+        # ordinary, renamed/copied and unmerged entries have 8, 9 and 10 fields before the path
+        fields = record.split(' ', {'1': 8, '2': 9, 'u': 10}[kind])
+        xy, sub, filename = fields[1], fields[2], fields[-1]
+        if kind == '2':
+            next(records)  # the original path
+        if sub[0] == 'S':
+            submodules[filename] = SubmoduleStatus(sub[1] == 'C', sub[2] == 'M', sub[3] == 'U')
+        if kind == 'u':
             conflict.append(filename)
             merge = True
-    return GitStatus(merge, staged, modified, untracked, conflict)
+            continue
+        if xy[1] in ['M', 'D']:
+            modified.append(filename)
+        if xy[1] in ['M', 'D', '.'] and xy[0] in ['M', 'A', 'R', 'C', 'D']:
+            staged.append(filename)
+    if stream.error is not None:
+        print stream.error
+        return None
+    return GitStatus(merge, staged, modified, untracked_files, conflict, submodules)
+
+
+def get_stopped_step():
+    """
+    Everything continuing a stopped rebase / cherry-pick step needs, from a single `git status` read of the index
+    :return: ({path: {stage: (mode, sha)}} of the unmerged entries, whether other changes are staged), None on error
+    """
+    stream = GitStream(['status', '--porcelain=v2', '-z', '--untracked-files=no', '--ignore-submodules=dirty'])
+    unmerged = {}
+    staged = False
+    records = iter(stream)
+    for record in records:
+        kind = record[:1]
+        if kind == 'u':
+            # u <XY> <sub> <m1> <m2> <m3> <mW> <h1> <h2> <h3> <path>, a missing stage has mode 000000
+            fields = record.split(' ', 10)
+            unmerged[fields[10]] = dict((stage, (fields[2 + stage], fields[6 + stage])) for stage in (1, 2, 3)
+                                        if fields[2 + stage] != '000000')
+        elif kind in ('1', '2'):
+            staged = staged or record[2] != '.'
+            if kind == '2':
+                next(records)  # the original path
+    if stream.error is not None:
+        return None
+    return unmerged, staged
+
+
+def get_content_conflicts(unmerged):
+    """
+    :return: the conflicted paths which aren't submodule pointers
+    """
+    return [path for path, stages in sorted(unmerged.iteritems())
+            if modules.is_module_excluded(path) or 2 not in stages or 3 not in stages
+            or stages[2][0] != '160000' or stages[3][0] != '160000']
+
+
+def checked_out_commit(path):
+    """
+    Read the commit checked out at path from its HEAD and refs, without running git
+    :return: the sha, None if nothing is checked out there
+    """
+    git_dir = resolve_git_dir(path)
+    common_dir = git_dir
+    try:
+        # linked worktrees (the isolated worktree's submodules) share the refs of their main repository
+        common_dir = os.path.normpath(os.path.join(git_dir, file(os.path.join(git_dir, 'commondir')).read().strip()))
+    except IOError:
+        pass
+    return RefDatabase(git_dir, common_dir).head()
+
+
+def gitlink_resolutions(unmerged):
+    """
+    Like `git add <submodule>`, a conflicting submodule pointer is resolved to the commit checked out in the
+    submodule, which lobo rebased before its superproject. A submodule that isn't checked out gets the commit being
+    replayed (stage 3, "theirs" while rebasing), fix-refs records the actual commit later
+    :return: {path: sha}
+    """
+    resolutions = {}
+    for path, stages in unmerged.iteritems():
+        resolutions[path] = checked_out_commit(os.path.join(work_dir(), path)) or stages[3][1]
+    return resolutions
+
+
+def resolve_gitlink_conflicts(resolutions):
+    """
+    Stage all the resolved submodule pointers with a single update-index
+    :return: an error, None on success
+    """
+    args = ['update-index']
+    for path, sha in sorted(resolutions.iteritems()):
+        print "Adding %s" % path
+        args.extend(['--cacheinfo', '160000,%s,%s' % (sha, path)])
+    _, err = gitcmd(args)
+    return err
+
+
+def is_submodule_conflict(gitstatus, filename):
+    return filename in gitstatus.submodules and not modules.is_module_excluded(filename)
 
 
 def get_author():
     """
     :return: author name of last commit
     """
-    author, _ = gitcmd(['--no-pager', 'show', '-s', "--format='%an <%ae>''"])
-    return author
+    return get_object_service().author('HEAD')
+
+class FetchPlanner(object):
+    """
+    Fetch each repository at most once per lobo command: branches planned ahead by the command are fetched
+    along with the first fetch of every repository, and fetching what was already fetched is a no-op
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.planned = set()
+        self.plan_all = False
+        self.fetched = defaultdict(set)
+        self.fetched_all = set()
+
+    def plan(self, branches=None):
+        """
+        Declare branches the command will need, None for everything
+        """
+        with self.lock:
+            if branches is None:
+                self.plan_all = True
+            else:
+                self.planned.update(branches)
+
+    def __call__(self, branches=None):
+        repo = os.path.abspath(work_dir())
+        with self.lock:
+            if repo in self.fetched_all:
+                return None, None
+            if branches is not None and set(branches) <= self.fetched[repo]:
+                return None, None
+            if branches is None or self.plan_all:
+                wanted = None
+            else:
+                wanted = sorted((set(branches) | self.planned) - self.fetched[repo])
+
+        if wanted is not None:
+            ret, err = gitcmd(['fetch', 'origin'] + wanted + ['--no-recurse-submodules'])
+            if err is None:
+                with self.lock:
+                    self.fetched[repo].update(wanted)
+                return ret, err
+            # some branch doesn't exist in this repository, fetch everything instead
+        ret, err = gitcmd(['fetch', '--no-recurse-submodules'])
+        if err is None:
+            with self.lock:
+                self.fetched_all.add(repo)
+        return ret, err
+
+
+# (ancestor sha, descendant sha) -> bool, commits never change so this holds for the whole process
+ancestry_cache = {}
+ancestry_lock = threading.Lock()
+
+
+def are_ancestors(pairs):
+    """
+    Answer "is A an ancestor of B" for a batch of (A, B) refs or shas. Answers are cached by commit pair,
+    and only the pairs that weren't asked before are checked with `merge-base --is-ancestor`
+    :return: a list of bools, in the order of pairs. A commit is its own ancestor, a missing ref is nobody's
+    """
+    service = get_object_service()
+    resolved = [(service.rev_parse(a + '^{commit}'), service.rev_parse(b + '^{commit}')) for a, b in pairs]
+    with ancestry_lock:
+        todo = sorted(set(pair for pair in resolved
+                          if None not in pair and pair[0] != pair[1] and pair not in ancestry_cache))
 
-def fetch(branches=None):
-    if branches is not None:
-        return gitcmd(['fetch', 'origin']+branches+['--no-recurse-submodules'])
+    def check(pair):
+        _, err = gitcmd(['merge-base', '--is-ancestor', pair[0], pair[1]])
+        # exit code 1 (no output) means "no", anything else is an actual error that shouldn't be cached
+        return pair, err is None, err is None or err == ''
+
+    if len(todo) > 1:
+        cwd = work_dir()
+
+        def check_in_cwd(pair):
+            with work_in(cwd):
+                return check(pair)
+
+        pool = ThreadPool(processes=min(len(todo), get_workers()))
+        try:
+            results = pool.map(check_in_cwd, todo)
+        finally:
+            pool.close()
+            pool.join()
     else:
-        return gitcmd(['fetch', '--no-recurse-submodules'])
+        results = map(check, todo)
+
+    answers = {}
+    with ancestry_lock:
+        for pair, is_ancestor, conclusive in results:
+            answers[pair] = is_ancestor
+            if conclusive:
+                ancestry_cache[pair] = is_ancestor
+        answers.update((pair, ancestry_cache[pair]) for pair in resolved if pair in ancestry_cache)
+    return [None not in pair and (pair[0] == pair[1] or answers.get(pair, False)) for pair in resolved]
+
+
+def is_ancestor(ancestor, descendant="HEAD"):
+    return are_ancestors([(ancestor, descendant)])[0]
 
 
 def is_merged_with(branchname, ref="HEAD"):
     # ref contains branchname
-    ret, _ = gitcmd(['branch','-r', '--merged',ref])
-    if ret is None:
-        print "No such branch {0}?".format(branchname)
-        ret = []
-    else:
-        ret = set(x[2:].strip() for x in ret.split('\n'))
-    return branchname in ret
+    return is_ancestor(branchname, ref)
 
 
 def get_all_branches(remote=True):
     if remote:
-        ret, _ = gitcmd(['branch', '-r'])
-        ret = set(x[2:].strip() for x in ret.split('\n'))
-        ret = [x.split('/', 1)[1] for x in ret if x.startswith('origin/')]
+        return get_ref_database().names('refs/remotes/origin/')
     else:
-        ret, _ = gitcmd(['branch'])
-        ret = set(x[2:].strip() for x in ret.split('\n'))
-    return list(ret)
+        return get_ref_database().names('refs/heads/')
 
 
 def is_remote_branch(branchname):
-    return branchname in get_all_branches(remote=True)
+    return get_ref_database().exists('refs/remotes/origin/%s' % branchname)
 
 
 def is_tag(tagname):
-    ret, err = gitcmd("tag -l %s" % tagname)
-    return ret.strip() == tagname
+    return get_ref_database().exists('refs/tags/%s' % tagname)
 
 
 def is_branch_diverged(branchname, ref='HEAD'):
-    head, _ = gitcmd(['rev-parse', 'HEAD'])
-    ref, _ = gitcmd(['rev-parse', branchname])
-    return head != ref
+    service = get_object_service()
+    return service.rev_parse('HEAD') != service.rev_parse(branchname)
 
 
 def get_git_dir():
@@ -153,31 +722,236 @@ def is_at_root():
 
 
 def get_rebase_step():
+    git_dir = os.path.join(work_dir(), get_git_dir())
     try:
-        return file(os.path.join(get_git_dir(), 'rebase-merge', 'msgnum')).read()
+        return file(os.path.join(git_dir, 'rebase-merge', 'msgnum')).read()
     except:
         try:
-            return file(os.path.join(get_git_dir(), 'rebase-apply', 'next')).read()
+            return file(os.path.join(git_dir, 'rebase-apply', 'next')).read()
         except:
             return None
 
 
+def get_cherry_pick_step():
+    git_dir = os.path.join(work_dir(), get_git_dir())
+    step = []
+    for name in ['CHERRY_PICK_HEAD', os.path.join('sequencer', 'todo')]:
+        try:
+            step.append(file(os.path.join(git_dir, name)).read())
+        except IOError:
+            step.append(None)
+    return None if step == [None, None] else step
+
+
+def cherry_pick(commits=None):
+    """
+    Apply commits with the sequencer, getting past submodule pointer conflicts like rebase-if-needed does.
+    Without commits, continue the cherry-pick we're in the middle of
+    """
+    if commits:
+        ret, err = gitcmd(['cherry-pick'] + list(commits))
+    else:
+        ret, err = gitcmd(['cherry-pick', '--allow-empty-message', '--continue'])
+    return continue_sequence('cherry-pick', ret, err, get_cherry_pick_step)
+
+
+class JsonCache(object):
+    """
+    A versioned JSON file under <git dir>/lobo/. It's written to a temporary file that's renamed into place,
+    so concurrent lobo runs never see a half written cache
+    """
+
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+
+    def path(self, root):
+        return os.path.join(resolve_git_dir(root), 'lobo', self.name)
+
+    def load(self, root):
+        """
+        :return: the cached fields, None if there's no cache of this version
+        """
+        try:
+            with open(self.path(root)) as f:
+                cached = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if not isinstance(cached, dict) or cached.get('version') != self.version:
+            return None
+        return cached
+
+    def save(self, root, **fields):
+        if not os.path.isdir(resolve_git_dir(root)):
+            return
+        filename = self.path(root)
+        fields['version'] = self.version
+        tmp = None
+        try:
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=os.path.basename(filename) + '.')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(fields, f)
+            os.rename(tmp, filename)
+        except (IOError, OSError):
+            # a cache is an optimization, whatever it saves is redone next time
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+
+
+class SubmoduleGraph(object):
+    """
+    The submodule topology of a repository, discovered once and cached in memory and under .git/lobo/.
+    It stays valid as long as the .gitmodules, gitlink entries and initialization state of its repositories do.
+    Submodules are addressed by their path relative to the root, e.g. './mid/libs/leaf'
+    """
+    CACHE = JsonCache('submodules.json', 1)
+
+    def __init__(self, root, submodules, stamps=None, gitlinks=None):
+        self.root = root
+        # pre ordered [submodule, parent submodule, initialized], the root's parent is None
+        self.submodules = submodules
+        # repository -> stamps of its .gitmodules, index and config
+        self.stamps = stamps or {}
+        # repository -> the gitlink entries of its index
+        self.gitlinks = gitlinks or {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def discover(cls, root):
+        ret, err = gitcmd(['submodule', 'status', '--recursive'], root)
+        if ret is None:
+            return None
+        submodules = [['.', None, True]]
+        repos = ['.']
+        for l in ret.split('\n'):
+            s = l[1:].split()
+            if len(s) < 2:
+                if l != "":
+                    print "BAD SUBMODULE: %s" % l
+                continue
+            path = os.path.join('.', s[1])
+            parent = max((repo for repo in repos if path.startswith(repo + '/')), key=len)
+            initialized = not l.startswith('-')
+            submodules.append([path, parent, initialized])
+            if initialized:
+                repos.append(path)
+        graph = cls(root, submodules)
+        for repo in repos:
+            graph.stamps[repo] = graph.stamp(repo)
+            graph.gitlinks[repo] = graph.read_gitlinks(repo)
+        graph.save()
+        return graph
+
+    @classmethod
+    def load(cls, root):
+        cached = cls.CACHE.load(root)
+        if cached is None:
+            return None
+        # json hands back unicode, keep paths as plain strings like the rest of git_tool
+        submodules = [[str(path), parent and str(parent), initialized]
+                      for path, parent, initialized in cached['submodules']]
+        stamps = dict((str(repo), stamp) for repo, stamp in cached['stamps'].iteritems())
+        gitlinks = dict((str(repo), map(str, links)) for repo, links in cached['gitlinks'].iteritems())
+        return cls(root, submodules, stamps, gitlinks)
+
+    def save(self):
+        self.CACHE.save(self.root, submodules=self.submodules, stamps=self.stamps, gitlinks=self.gitlinks)
+
+    def stamp(self, repo):
+        path = os.path.join(self.root, repo)
+        git_dir = resolve_git_dir(path)
+        return [file_stamp(os.path.join(path, '.gitmodules')), file_stamp(os.path.join(git_dir, 'index')),
+                file_stamp(os.path.join(git_dir, 'config'))]
+
+    def read_gitlinks(self, repo):
+        children = [path[len(repo) + 1:] for path in self.children(repo)]
+        if not children:
+            return []
+        ret, _ = gitcmd(['ls-files', '--stage', '--'] + children, os.path.join(self.root, repo))
+        entries = [l.split(None, 3) for l in (ret or '').split('\n')]
+        return sorted(set(entry[3] for entry in entries if len(entry) == 4 and entry[0] == '160000'))
+
+    def is_valid(self):
+        """
+        Check the stamps of all repositories. If only an index changed, the graph is still valid as long as
+        that index has the same gitlinks
+        """
+        with self.lock:
+            changed = False
+            for repo, stamp in self.stamps.items():
+                current = self.stamp(repo)
+                if current == stamp:
+                    continue
+                if current[0] != stamp[0] or current[2] != stamp[2]:
+                    return False
+                if self.read_gitlinks(repo) != self.gitlinks[repo]:
+                    return False
+                self.stamps[repo] = current
+                changed = True
+            if changed:
+                self.save()
+            return True
+
+    def repos(self):
+        return set(self.stamps.keys())
+
+    def children(self, repo, initialized=None):
+        return [path for path, parent, is_initialized in self.submodules
+                if parent == repo and initialized in (None, is_initialized)]
+
+    def subtree(self, repo='.'):
+        """
+        :return: a pre ordered list of (submodule, parent submodule) of the initialized submodules under repo,
+        with paths relative to repo
+        """
+        def relative(path):
+            return '.' + path[len(repo):] if path is not None else None
+
+        tree = [(repo, None)]
+        inside = set([repo])
+        for path, parent, initialized in self.submodules:
+            if parent in inside and initialized:
+                inside.add(path)
+                tree.append((path, parent))
+        return [(relative(path), relative(parent)) for path, parent in tree]
+
+
+submodule_graphs = {}
+submodule_graphs_lock = threading.Lock()
+
+
+def get_submodule_graph():
+    """
+    :return: (graph, the current repository within it), reusing the graph of a superproject we already know of
+    """
+    path = os.path.abspath(work_dir())
+    with submodule_graphs_lock:
+        for root, graph in submodule_graphs.items():
+            relative = os.path.relpath(path, root)
+            repo = '.' if relative == '.' else os.path.join('.', relative)
+            if repo in graph.repos():
+                if graph.is_valid():
+                    return graph, repo
+                del submodule_graphs[root]
+                break
+
+        graph = SubmoduleGraph.load(path)
+        if graph is None or not graph.is_valid():
+            graph = SubmoduleGraph.discover(path)
+            if graph is None:
+                return None, None
+        submodule_graphs[path] = graph
+        return graph, '.'
+
+
 def get_submodules():
-    ret, err = gitcmd(['submodule', 'status'])
-    if err is not None:
+    graph, repo = get_submodule_graph()
+    if graph is None:
         return None
-    subs = []
-    for l in ret.split('\n'):
-        if l != "":
-            s = l.split()
-            if len(s) > 1:
-                module_name = s[1]
-                if not modules.is_module_excluded(module_name):
-                    subs.append(module_name)
-            else:
-                print "Failed to get submodules, offending line is %r" % l
-                return None
-    return subs
+    subs = [path[len(repo) + 1:] for path in graph.children(repo)]
+    return [module_name for module_name in subs if not modules.is_module_excluded(module_name)]
 
 
 def get_uninited_submodules():
@@ -185,20 +959,314 @@ def get_uninited_submodules():
     Check if there's a uninitialized submodule, returns a list of uninitialized modules.
     An empty list means all modules are initialized
     """
-    ret = gitcmd('submodule status')
-    modules = ret[0].split('\n')
+    graph, repo = get_submodule_graph()
+    if graph is None:
+        return []
+    return [path[len(repo) + 1:] for path in graph.children(repo, initialized=False)]
 
-    # Each SHA-1 will be prefixed with:
-    # - if the submodule is not initialized
-    # + if the currently checked out submodule commit does not match the SHA-1 found in the index of the containing repository
-    # U if the submodule has merge conflicts.
-    uninited_modules = [s for s in modules if s.startswith('-')]
 
-    return uninited_modules
+# the subject of a commit for an issue, or of a revert of one
+LOG_SUBJECT_BE_LIKE = re.compile(r'^(Revert ")*(FIXES )?([A-Z]+-\d+): ')
+
+
+class IssueIndex(object):
+    """
+    Issue key -> commits of a ref, parsed from the commit subjects and cached under .git/lobo/.
+    When the ref moves, only the commits since the last indexed tip are read
+    """
+    CACHE = JsonCache('issues.json', 1)
+
+    def __init__(self, path, refs=None):
+        self.path = path
+        # ref -> {'tip': commit, 'issues': {key: [commit, ...]}, 'reverts': {key: [commit, ...]}}, oldest first
+        self.refs = refs or {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        cached = cls.CACHE.load(path)
+        if cached is None:
+            return cls(path)
+        refs = {}
+        for ref, entry in cached['refs'].iteritems():
+            refs[str(ref)] = {'tip': str(entry['tip']),
+                              'issues': dict((str(k), map(str, v)) for k, v in entry['issues'].iteritems()),
+                              'reverts': dict((str(k), map(str, v)) for k, v in entry['reverts'].iteritems())}
+        return cls(path, refs)
+
+    def save(self):
+        self.CACHE.save(self.path, refs=self.refs)
+
+    def update(self, ref):
+        """
+        Bring the index of ref up to its current tip, rebuilding it if the ref was rewritten
+        :return: the index entry of ref, None if ref doesn't exist
+        """
+        with self.lock, work_in(self.path):
+            tip = get_object_service().rev_parse('%s^{commit}' % ref)
+            if tip is None:
+                return None
+            entry = self.refs.get(ref)
+            if entry is not None and entry['tip'] == tip:
+                return entry
+            if entry is None or not is_ancestor(entry['tip'], tip):
+                entry = {'tip': None, 'issues': {}, 'reverts': {}}
+            revisions = tip if entry['tip'] is None else '%s..%s' % (entry['tip'], tip)
+            stream = GitStream(['log', '--reverse', '--format=%H %s', revisions], sep='\n')
+            for line in stream:
+                commit, _, subject = line.partition(' ')
+                m = LOG_SUBJECT_BE_LIKE.match(subject)
+                if m is not None:
+                    entry['reverts' if m.group(1) else 'issues'].setdefault(m.group(3), []).append(commit)
+            if stream.error is not None:
+                return None
+            entry['tip'] = tip
+            self.refs[ref] = entry
+            self.save()
+            return entry
+
+    def commits(self, issue, ref='origin/master', reverts=False):
+        """
+        :return: the commits of ref for issue, oldest first, including the reverts of its commits if asked to
+        """
+        entry = self.update(ref)
+        if entry is None:
+            return []
+        commits = list(entry['issues'].get(issue, []))
+        if reverts:
+            commits.extend(entry['reverts'].get(issue, []))
+        return commits
+
+    def issues(self, commits, ref='origin/master'):
+        """
+        :return: the keys of the issues the given commits of ref belong to
+        """
+        entry = self.update(ref)
+        if entry is None:
+            return set()
+        commits = set(commits)
+        return set(key for key, issue_commits in entry['issues'].iteritems()
+                   if any(commit in commits for commit in issue_commits))
+
+
+issue_indexes = {}
+issue_indexes_lock = threading.Lock()
+
+
+def get_issue_index():
+    path = os.path.abspath(work_dir())
+    with issue_indexes_lock:
+        if path not in issue_indexes:
+            issue_indexes[path] = IssueIndex.load(path)
+        return issue_indexes[path]
+
+
+class PatchIdCache(object):
+    """
+    Commit -> patch-id (git patch-id --stable), cached under .git/lobo/ so each commit's diff is hashed only once.
+    Commits without a diff map to ''
+    """
+    CACHE = JsonCache('patch-ids.json', 1)
+    BATCH_SIZE = 1000
+
+    def __init__(self, path, patch_ids=None):
+        self.path = path
+        self.patch_ids = patch_ids or {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        cached = cls.CACHE.load(path)
+        if cached is None:
+            return cls(path)
+        return cls(path, dict((str(k), str(v)) for k, v in cached['patch_ids'].iteritems()))
+
+    def save(self):
+        self.CACHE.save(self.path, patch_ids=self.patch_ids)
+
+    def compute(self, commits):
+        """
+        Hash the diffs of commits, `git log -p` piped straight into `git patch-id`
+        """
+        log = command_parts(['log', '--no-walk=unsorted', '-p', '--format=commit %H'] + commits)
+        patch_id = command_parts(['patch-id', '--stable'])
+        started = time.time()
+        with span('git patch-id', 'git', argv=log, submodule=relative_submodule(self.path)):
+            p1 = popen(log, cwd=self.path, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            p2 = popen(patch_id, cwd=self.path, stdin=p1.stdout, stdout=subprocess.PIPE)
+            p1.stdout.close()
+            ret, _ = p2.communicate()
+            err = p1.stderr.read()
+            p1.wait()
+        journal.record(argv=log + ['|'] + patch_id, cwd=self.path, submodule=relative_submodule(self.path),
+                       start=started, duration=time.time() - started, exit_code=p1.returncode or p2.returncode,
+                       output_size=len(ret) + len(err))
+        if p1.returncode != 0 or p2.returncode != 0:
+            return None, err.rstrip()
+        patch_ids = dict((commit, '') for commit in commits)
+        for line in ret.split('\n'):
+            parts = line.split()
+            if len(parts) == 2:
+                patch_ids[parts[1]] = parts[0]
+        return patch_ids, None
+
+    def get(self, commits):
+        """
+        :return: ({commit: patch-id}, err), hashing only the commits we haven't seen before
+        """
+        with self.lock:
+            missing = [commit for commit in commits if commit not in self.patch_ids]
+            for i in range(0, len(missing), self.BATCH_SIZE):
+                patch_ids, err = self.compute(missing[i:i + self.BATCH_SIZE])
+                if err is not None:
+                    return None, err
+                self.patch_ids.update(patch_ids)
+            if missing:
+                self.save()
+            return dict((commit, self.patch_ids[commit]) for commit in commits), None
+
+
+patch_id_caches = {}
+patch_id_caches_lock = threading.Lock()
+
+
+def get_patch_id_cache():
+    path = os.path.abspath(work_dir())
+    with patch_id_caches_lock:
+        if path not in patch_id_caches:
+            patch_id_caches[path] = PatchIdCache.load(path)
+        return patch_id_caches[path]
+
+
+def cherry(upstream, head, candidates=None):
+    """
+    Like `git log --cherry --reverse upstream...head`, with the patch-ids coming from the PatchIdCache
+    :param candidates: only consider these commits of head (saves hashing the rest)
+    :return: (the commits of head which upstream has no equivalent of, oldest first, err)
+    """
+    ours, err = gitcmd(['rev-list', '--no-merges', '%s..%s' % (head, upstream)])
+    if err is not None:
+        return None, err
+    theirs, err = gitcmd(['rev-list', '--no-merges', '--reverse', '--date-order', '%s..%s' % (upstream, head)])
+    if err is not None:
+        return None, err
+    ours = ours.split()
+    theirs = theirs.split()
+    if candidates is not None:
+        theirs = [commit for commit in theirs if commit in candidates]
+    if not theirs:
+        return [], None
+    patch_ids, err = get_patch_id_cache().get(ours + theirs)
+    if err is not None:
+        return None, err
+    applied = set(patch_ids[commit] for commit in ours if patch_ids[commit])
+    return [commit for commit in theirs if not patch_ids[commit] or patch_ids[commit] not in applied], None
+
+
+class IsolatedWorktree(object):
+    """
+    A lobo managed checkout of the whole project - the superproject and every initialized submodule, each a
+    `git worktree` of the developer's repository, so objects and refs are shared - for running a workflow without
+    touching the interactive checkout.
+    Checkouts live in slots under .git/lobo/worktrees/ and are reused between runs. A run holds its slot locked, so
+    several runs can go on side by side
+    """
+
+    def __init__(self, root='.'):
+        self.root = os.path.abspath(root)
+        self.slot = None
+        self.lock_file = None
+
+    def slots_dir(self):
+        return os.path.join(resolve_git_dir(self.root), 'lobo', 'worktrees')
+
+    def acquire(self):
+        if not os.path.isdir(self.slots_dir()):
+            os.makedirs(self.slots_dir())
+        i = 0
+        while True:
+            slot = os.path.join(self.slots_dir(), 'slot-%d' % i)
+            lock_file = open(slot + '.lock', 'w')
+            # git children (the long lived cat-file above all) mustn't inherit the lock and hold it past release
+            fcntl.fcntl(lock_file, fcntl.F_SETFD, fcntl.fcntl(lock_file, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock_file.close()
+                i += 1
+                continue
+            self.slot = slot
+            self.lock_file = lock_file
+            return slot
+
+    def release(self):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+        self.slot = None
+
+    def checkout(self, source, path, commit):
+        """
+        Check commit out (detached) at path, adding path as a worktree of the repository at source the first time
+        """
+        if not os.path.exists(os.path.join(path, '.git')):
+            gitcmd(['worktree', 'prune'], source)
+            return gitcmd(['worktree', 'add', '--detach', path, commit], source)
+        with work_in(path):
+            # whatever an interrupted run left behind
+            if get_rebase_step() is not None:
+                gitcmd(['rebase', '--abort'])
+            gitcmd(['reset', '-q', '--hard'])
+            return gitcmd(['checkout', '-q', '-f', '--detach', commit])
+
+    def prepare(self, ref):
+        """
+        Check ref out in every repository of the slot, repositories without ref get the commit their superproject
+        points at
+        """
+        with work_in(self.root):
+            graph, _ = get_submodule_graph()
+        if graph is None:
+            return None, "no submodules?"
+        for path, parent, initialized in graph.submodules:
+            if not initialized:
+                continue
+            source = os.path.normpath(os.path.join(self.root, path))
+            target = os.path.normpath(os.path.join(self.slot, path))
+            commit, err = gitcmd(['rev-parse', '-q', '--verify', '%s^{commit}' % ref], source)
+            if err is not None and parent is not None:
+                commit, err = gitcmd(['rev-parse', 'HEAD:%s' % os.path.relpath(path, parent)],
+                                     os.path.join(self.slot, parent))
+            if err is not None:
+                return None, "%s: can't find %s" % (path, ref)
+            _, err = self.checkout(source, target, commit)
+            if err is not None:
+                return None, err
+        return self.slot, None
+
+    @contextmanager
+    def __call__(self, ref):
+        """
+        Run the body from a slot with ref checked out in all the repositories
+        """
+        self.acquire()
+        try:
+            with span('isolated worktree', 'phase', slot=self.slot):
+                _, err = self.prepare(ref)
+            if err is not None:
+                print RED("Couldn't prepare an isolated worktree: %s" % err)
+                exit(1)
+            with cd(self.slot):
+                yield self.slot
+        finally:
+            self.release()
+
+
+def isolated_worktree(ref):
+    return IsolatedWorktree()(ref)
 
 
 class GitConfig(object):
-    METHOD = 'git-config'
     DOC = 'Get a git configuration item'
 
     warnings.warn("The 'git-tool.GetConfig' class is deprecated, use configuration.GetConfig, "
@@ -221,7 +1289,6 @@ class GitConfig(object):
 
 
 class TreeRoot(object):
-    METHOD = 'tree-root'
     DOC = 'Get the root of the current git repo'
 
     @classmethod
@@ -237,7 +1304,6 @@ class TreeRoot(object):
 
 
 class GetRepo(object):
-    METHOD = 'get-repo'
     DOC = 'Get the name of the current repo'
 
     @classmethod
@@ -256,7 +1322,6 @@ class GetRepo(object):
 
 
 class CompareBranches(object):
-    METHOD = 'compare-branches'
     DOC = 'Get a list of commits from branch A to branch B'
 
     @classmethod
@@ -275,7 +1340,6 @@ class CompareBranches(object):
 
 
 class GetRemote(object):
-    METHOD = 'get-remote'
     DOC = 'Get the target of a specific remote'
 
     @classmethod
@@ -293,17 +1357,19 @@ class GetRemote(object):
 
 
 class RecurseSubmodules(object):
-    METHOD = 'recurse-submodules'
     DOC = 'Run a command recursively on all submodules'
 
     @classmethod
     def setup_argparser(cls, parser):
         parser.add_argument("-p", help="post order traversal: start with leaves and go up to the top",
                             action="store_true", dest="post_traversal")
+        parser.add_argument("-j", help="run on up to this many submodules concurrently",
+                            type=int, dest="workers", default=None)
         parser.add_argument("cmd", help="command to perform")
 
     def handle(self, namespace):
-        for submodule, ret in self(namespace.cmd, namespace.post_traversal):
+        for submodule, ret in self(namespace.cmd, namespace.post_traversal,
+                                   concurrent=namespace.workers is not None, workers=namespace.workers):
             ret, err = ret
             print submodule
             print '-' * len(submodule)
@@ -314,40 +1380,114 @@ class RecurseSubmodules(object):
         ret = cwd
         if root_first:
             yield ret
-        subs, _ = gitcmd('submodule status', cwd)
-        subs = [l.split() for l in subs.split('\n') if l != ""]
-        for l in subs:
-            if len(l) > 1:
-                fullpath = os.path.join(cwd, l[1])
-                for x in self.all_submodules(fullpath, root_first):
-                    yield x
-            else:
-                print "BAD SUBMODULE: %s" % " ".join(l)
+        # looked up only once cwd was handled, so submodules it initialized are traversed too
+        for fullpath in self.child_submodules(cwd):
+            for x in self.all_submodules(fullpath, root_first):
+                yield x
         if not root_first:
             yield ret
 
-    def __call__(self, cmd, post_traversal=False, concurrent=False):
+    def child_submodules(self, cwd='.'):
+        """
+        :return: the initialized submodules directly under cwd
+        """
+        with work_in(os.path.join(work_dir(), cwd)):
+            graph, repo = get_submodule_graph()
+        if graph is None:
+            return []
+        # graph paths start with '.', rebase them on cwd
+        return [cwd + submodule[len(repo):] for submodule in graph.children(repo, initialized=True)]
+
+    def submodule_tree(self, cwd='.'):
+        """
+        :return: a pre-ordered list of (submodule, parent submodule) pairs, the root's parent is None
+        """
+        with work_in(os.path.join(work_dir(), cwd)):
+            graph, repo = get_submodule_graph()
+        if graph is None:
+            return [(cwd, None)]
+        return [(cwd + submodule[1:], None if parent is None else cwd + parent[1:])
+                for submodule, parent in graph.subtree(repo)]
+
+    def run(self, cmd, submodule):
+        with span(submodule, 'submodule'):
+            if callable(cmd):
+                return cmd()
+            return gitcmd(cmd, git=False)
+
+    def run_sequential(self, cmd, post_traversal):
         for submodule in self.all_submodules(root_first=not post_traversal):
             with cd(submodule):
                 if modules.is_module_excluded(submodule):
                     continue
+                o = self.run(cmd, submodule)
+            yield submodule, o
 
-                pool = ThreadPool(processes=4) if concurrent else None
-                if callable(cmd):
-                    if concurrent:
-                        o = pool.apply_async(cmd).get()
-                    else:
-                        o = cmd()
+    def run_concurrent(self, cmd, post_traversal, workers):
+        """
+        Run cmd on a pool of workers, yielding results as they complete.
+        A submodule is only scheduled once its dependencies are done: its children for post order traversal
+        (so fix-refs sees committed children), its parent otherwise.
+        """
+        done = Queue.Queue()
+        pool = ThreadPool(processes=workers)
+
+        def task(submodule):
+            try:
+                with work_in(submodule):
+                    done.put((submodule, self.run(cmd, submodule), None))
+            except BaseException:
+                # SystemExit and KeyboardInterrupt too, a worker that dies without a result would hang the caller
+                done.put((submodule, None, sys.exc_info()))
+
+        def schedule(submodule):
+            if modules.is_module_excluded(submodule):
+                done.put((submodule, None, None))
+            else:
+                pool.apply_async(task, (submodule,))
+
+        if post_traversal:
+            tree = self.submodule_tree()
+            parents = dict(tree)
+            pending = Counter(parent for _, parent in tree if parent is not None)
+            for submodule, _ in tree:
+                if pending[submodule] == 0:
+                    schedule(submodule)
+            remaining = len(tree)
+        else:
+            schedule('.')
+            remaining = 1
+        try:
+            while remaining > 0:
+                submodule, o, exc_info = done.get()
+                remaining -= 1
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                if post_traversal:
+                    parent = parents[submodule]
+                    if parent is not None:
+                        pending[parent] -= 1
+                        if pending[parent] == 0:
+                            schedule(parent)
                 else:
-                    if concurrent:
-                        o = pool.apply_async(gitcmd, (cmd, False)).get()
-                    else:
-                        o = gitcmd(cmd, git=False)
-            yield submodule, o
+                    # looked up only once the parent is done, so submodules it initialized are handled too
+                    children = self.child_submodules(submodule)
+                    remaining += len(children)
+                    for child in children:
+                        schedule(child)
+                if not modules.is_module_excluded(submodule):
+                    yield submodule, o
+        finally:
+            pool.close()
+            pool.join()
+
+    def __call__(self, cmd, post_traversal=False, concurrent=False, workers=None):
+        if concurrent:
+            return self.run_concurrent(cmd, post_traversal, workers or get_workers())
+        return self.run_sequential(cmd, post_traversal)
 
 
 class NewBranch(object):
-    METHOD = 'new-branch'
     DOC = 'Create and switch to a new branch'
 
     @classmethod
@@ -367,7 +1507,6 @@ class NewBranch(object):
 
 
 class Push(object):
-    METHOD = 'push'
     DOC = 'Push the current branch (or other, if specified) to origin'
     FORCE = False
 
@@ -379,7 +1518,7 @@ class Push(object):
     def handle(self, namespace):
         print self(namespace.branchname)
 
-    def __call__(self, branch=None, bypass_hooks=True):
+    def __call__(self, branch=None, bypass_hooks=True, source=None):
         if branch is None:
             branch = get_current_branch()
         args = ['push']
@@ -387,18 +1526,20 @@ class Push(object):
             args.append('-f')
         if bypass_hooks:
             args.append('--no-verify')
-        args.extend(['origin', '{0}:{0}'.format(branch)])
+        # source lets a detached HEAD (e.g. in an isolated worktree) be pushed as branch
+        if source is None:
+            args.extend(['origin', '{0}:{0}'.format(branch)])
+        else:
+            args.extend(['origin', '{0}:refs/heads/{1}'.format(source, branch)])
         return gitcmd(args)
 
 
 class ForcePush(Push):
-    METHOD = 'force-push'
     DOC = 'Force push the current branch (or other, if specified) to origin'
     FORCE = True
 
 
 class GetCurrentBranch(object):
-    METHOD = 'get-current-branch'
     DOC = 'get the name of the current branch'
 
     @classmethod
@@ -409,12 +1550,10 @@ class GetCurrentBranch(object):
         print self()
 
     def __call__(self):
-        ret, err = gitcmd('rev-parse --abbrev-ref HEAD')
-        return ret if ret != 'HEAD' else None
+        return get_ref_database().current_branch()
 
 
 class CheckoutRemote(object):
-    METHOD = 'checkout-remote'
     DOC = """Check out a remote branch or tag;
 for branches: create a local branch if needed and reset that branch''s state to match its remote counterpart"""
 
@@ -433,11 +1572,11 @@ for branches: create a local branch if needed and reset that branch''s state to
                 kind = "branch"
             else:
                 kind = "tag"
-        ret, err = gitcmd("rev-parse HEAD")
-        if ret is not None:
-            gitcmd("checkout %s" % ret)
+        head = get_object_service().rev_parse('HEAD')
+        if head is not None:
+            gitcmd("checkout %s" % head)
         else:
-            return ret, err
+            return None, "Failed to resolve HEAD"
         if kind == "branch":
             # not a tag
             ret, err = gitcmd("branch -f {0} origin/{0}".format(target))
@@ -461,8 +1600,39 @@ for branches: create a local branch if needed and reset that branch''s state to
         return None, None
 
 
+def continue_sequence(sequence, ret, err, get_step):
+    """
+    Drive a stopped rebase / cherry-pick sequence on, as long as it only stops on submodule pointer conflicts.
+    get_step tells whether the sequence made progress, so we don't loop on a step that won't apply
+    """
+    step = get_step()
+    while err is not None:
+        # one status read per stop, the working tree is never scanned
+        state = get_stopped_step()
+        if state is None:
+            return ret, err
+        unmerged, staged = state
+        content_conflicts = get_content_conflicts(unmerged)
+        if len(content_conflicts) > 0:
+            print "Conflict in non submodules %r" % content_conflicts
+            return ret, err
+        resolutions = gitlink_resolutions(unmerged)
+        if len(unmerged) > 0 and not staged and \
+                all(sha == unmerged[path][2][1] for path, sha in resolutions.iteritems()):
+            # resolved, the step leaves HEAD as it is, there's nothing to commit
+            ret, err = gitcmd([sequence, '--skip'])
+        else:
+            if len(resolutions) > 0 and resolve_gitlink_conflicts(resolutions) is not None:
+                return ret, err
+            ret, err = gitcmd([sequence, '--continue'])
+        if err is not None:
+            if get_step() == step:
+                return ret, err
+        step = get_step()
+    return ret, err
+
+
 class RebaseIfNeeded(object):
-    METHOD = 'rebase-if-needed'
     DOC = "Rebase this branch if needed, if we're in the middle of a rebase then continue it"
 
     @classmethod
@@ -482,47 +1652,62 @@ class RebaseIfNeeded(object):
                 ret, err = gitcmd(['rebase', '--autostash', 'origin/%s' % branchname])
             else:
                 ret, err = gitcmd(['rebase', '--continue'])
-            submodules = None
-            while err is not None:
-                gitstatus = status()
-                if submodules is None:
-                    submodules = get_submodules()
-                    if submodules is None:
-                        return ret, err
-                non_subs = set(gitstatus.conflict) - set(submodules)
-                if len(non_subs) > 0:
-                    print "Conflict in non submodules %r" % non_subs
-                    return ret, err
-                for sub in gitstatus.conflict:
-                    print "Adding %s" % sub
-                    _ret, _err = gitcmd(['add', sub])
-                    if _err is not None:
-                        return ret, err
-                ret, err = gitcmd(['rebase', '--continue'])
-                if err is not None:
-                    if get_rebase_step() == step:
-                        return ret, err
-                step = get_rebase_step()
-            return ret, err
+            return continue_sequence('rebase', ret, err, get_rebase_step)
+
+
+def author_env(author):
+    """
+    :return: the environment commit-tree needs to use author ('name <email>') instead of the configured user
+    """
+    if author is None:
+        return None
+    name, _, email = author.partition(' <')
+    return {'GIT_AUTHOR_NAME': name, 'GIT_AUTHOR_EMAIL': email.rstrip('>')}
+
+
+def replace_gitlinks(tree, gitlinks):
+    """
+    Write a copy of tree with the submodule pointers in gitlinks ({path: commit}) replaced.
+    The tree is built in a throwaway index, the real index and the working tree are left alone
+    :return: (tree, err)
+    """
+    temp_dir = tempfile.mkdtemp(prefix='lobo-')
+    env = {'GIT_INDEX_FILE': os.path.join(temp_dir, 'index')}
+    try:
+        _, err = gitcmd(['read-tree', tree], env=env)
+        if err is not None:
+            return None, err
+        args = ['update-index']
+        for path, commit in sorted(gitlinks.iteritems()):
+            args.extend(['--cacheinfo', '160000,%s,%s' % (commit, path)])
+        _, err = gitcmd(args, env=env)
+        if err is not None:
+            return None, err
+        return gitcmd(['write-tree'], env=env)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 class Squash(object):
-    METHOD = 'squash'
     DOC = "Squash this branch commits with master (we're already supposed to be rebased)"
 
     @classmethod
     def setup_argparser(cls, parser):
         parser.add_argument("message", help="message to use in unified commit")
+        parser.add_argument("--to", help="leave the current branch and working tree alone, "
+                                         "create the squashed commit as this branch (recursively)",
+                            dest="target", default=None)
 
     def handle(self, namespace):
-        self(namespace.message)
+        if namespace.target is not None:
+            resolve_errors(self.squash_tree(namespace.message, namespace.target), title="Squashing...")
+        else:
+            self(namespace.message)
 
     def __call__(self, message, author=None):
-        head, _ = gitcmd(['rev-parse', 'HEAD'])
+        head = get_object_service().rev_parse('HEAD')
         ret = "%s: Squashed, HEAD was at %s" % (get_repo(), head)
         # I used the script from http://rebaseandsqua.sh/
-        # Get the current branch name.
-        branch, _ = gitcmd(['rev-parse', '--abbrev-ref', 'HEAD'])
         # Get author of last commit
         if author is None:
             author = get_author()
@@ -541,9 +1726,201 @@ class Squash(object):
         gitcmd(['stash', 'pop'])
         return ret, None
 
+    def squash_to(self, target, message, branch='HEAD', author=None, gitlinks=None):
+        """
+        Point target at a single commit on top of the merge-base with origin/master, holding the tree of branch
+        (with the submodule pointers in gitlinks replaced). Only objects and refs are written, never the index or the
+        working tree, so it costs the same on any checkout
+        :return: (commit, err)
+        """
+        objects = get_object_service()
+        tip = objects.rev_parse(branch)
+        if tip is None:
+            return None, "%s: no such branch %s" % (get_repo(), branch)
+        base, err = gitcmd(['merge-base', 'origin/master', tip])
+        if err is not None:
+            return None, err
+        tip_tree = objects.rev_parse('%s^{tree}' % tip)
+        tree = tip_tree
+        if gitlinks:
+            tree, err = replace_gitlinks(tip_tree, gitlinks)
+            if err is not None:
+                return None, err
+        commit = tip
+        if base != tip or tree != tip_tree:
+            if author is None:
+                author = objects.author(tip)
+            commit, err = gitcmd(['commit-tree', tree, '-p', base, '-m', message], env=author_env(author))
+            if err is not None:
+                return None, err
+        _, err = gitcmd(['update-ref', '-m', 'lobo: squash %s' % branch, 'refs/heads/%s' % target, commit])
+        if err is not None:
+            return None, err
+        return commit, None
+
+    def squash_tree(self, message, target, branch='HEAD', author=None):
+        """
+        squash_to in every submodule, children first, so each superproject's squashed commit points at its
+        submodules' squashed commits
+        """
+        commits = {}
+
+        def squash_repo():
+            repo = os.path.abspath(work_dir())
+            gitlinks = {}
+            for sub in get_submodules() or []:
+                commit = commits.get(os.path.join(repo, sub))
+                if commit is not None:
+                    gitlinks[sub] = commit
+            commit, err = self.squash_to(target, message, branch, author, gitlinks)
+            if err is not None:
+                return None, err
+            commits[repo] = commit
+            return "%s: %s is at %s" % (get_repo(), target, commit), None
+
+        return recurse_submodules(squash_repo, post_traversal=True, concurrent=True)
+
+
+class MergeTrain(object):
+    """
+    Land several branches in one pass: each repository's new master is built in memory, one branch after the other,
+    on top of origin/master. Squashed (single commit) branches are replayed linearly, others are merged.
+    Nothing is checked out, trees come from `git merge-tree --write-tree` (git 2.38+) and commits from commit-tree
+    """
+    SUBMODULES_MESSAGE = 'lobo: Updating submodule references'
+    MIN_GIT_VERSION = (2, 38)
+
+    def __init__(self, branches, onto='origin/master', ok_no_ff=False):
+        """
+        :param ok_no_ff: also land branches that aren't rebased on onto, like `land --allow-not-ff`
+        """
+        self.branches = branches
+        self.onto = onto
+        self.ok_no_ff = ok_no_ff
+        # repository -> (commit its master should move to, the branches it got)
+        self.tips = {}
+
+    @classmethod
+    def check_git(cls):
+        """
+        :return: an error if this git can't build trains
+        """
+        version = git_version()
+        if version is None or version < cls.MIN_GIT_VERSION:
+            return "landing a merge train needs git %s or newer (for merge-tree --write-tree), this is %s" % (
+                '.'.join(map(str, cls.MIN_GIT_VERSION)), '.'.join(map(str, version)) if version else 'unknown')
+        return None
+
+    def merge_tree(self, ours, theirs):
+        """
+        :return: (tree, {conflicted path: {stage: (mode, sha)}}, err)
+        """
+        ret, err = gitcmd(['merge-tree', '--write-tree', ours, theirs])
+        if err is None:
+            return ret.split('\n')[0], {}, None
+        lines = err.split('\n')
+        conflicts = defaultdict(dict)
+        for line in lines[1:]:
+            if line == '':
+                break
+            info, _, path = line.partition('\t')
+            parts = info.split()
+            if len(parts) != 3 or not path:
+                return None, None, err
+            conflicts[path][int(parts[2])] = (parts[0], parts[1])
+        if len(lines[0]) != 40 or not conflicts:
+            return None, None, err
+        return lines[0], dict(conflicts), None
+
+    def add(self, tip, branch):
+        """
+        :return: (the new tip with branch on top of tip, err)
+        """
+        objects = get_object_service()
+        branch_tip = objects.rev_parse('%s^{commit}' % branch)
+        landed, ff, rebased = are_ancestors([(branch_tip, tip), (tip, branch_tip), (self.onto, branch_tip)])
+        if landed:
+            return tip, None
+        if not rebased and not self.ok_no_ff:
+            return None, "%s isn't rebased on %s (--allow-not-ff to land it anyway)" % (branch, self.onto)
+        if ff:
+            return branch_tip, None
+        commits, err = gitcmd(['rev-list', '%s..%s' % (self.onto, branch_tip)])
+        if err is not None:
+            return None, err
+        tree, conflicts, err = self.merge_tree(tip, branch_tip)
+        if err is not None:
+            return None, err
+        content_conflicts = sorted(path for path, stages in conflicts.iteritems()
+                                   if any(mode != '160000' for mode, _ in stages.values()))
+        if content_conflicts:
+            return None, "%s conflicts with the train in %r" % (branch, content_conflicts)
+        if conflicts:
+            # submodule pointers are set to the submodules' trains later on, meanwhile take the branch's
+            tree, err = replace_gitlinks(tree, dict((path, stages[3][1]) for path, stages in conflicts.iteritems()
+                                                    if 3 in stages))
+            if err is not None:
+                return None, err
+        if len(commits.split()) == 1:
+            info, err = gitcmd(['log', '-1', '--date=raw', '--format=%an%x00%ae%x00%ad%x00%B', branch_tip])
+            if err is not None:
+                return None, err
+            name, email, date, message = info.split('\0', 3)
+            env = {'GIT_AUTHOR_NAME': name, 'GIT_AUTHOR_EMAIL': email, 'GIT_AUTHOR_DATE': date}
+            return gitcmd(['commit-tree', tree, '-p', tip, '-m', message], env=env)
+        return gitcmd(['commit-tree', tree, '-p', tip, '-p', branch_tip,
+                       '-m', "Merge branch '%s'" % branch.split('/', 1)[-1]])
+
+    def build(self):
+        repo = os.path.abspath(work_dir())
+        objects = get_object_service()
+        tip = objects.rev_parse('%s^{commit}' % self.onto)
+        if tip is None:
+            return None, "no %s?" % self.onto
+        landed = []
+        for branch in self.branches:
+            if objects.rev_parse('%s^{commit}' % branch) is None:
+                continue
+            new_tip, err = self.add(tip, branch)
+            if err is not None:
+                return None, err
+            if new_tip != tip:
+                landed.append(branch)
+            tip = new_tip
+        gitlinks = {}
+        for sub in get_submodules() or []:
+            sub_tip = self.tips.get(os.path.join(repo, sub))
+            if sub_tip is not None and sub_tip[1]:
+                gitlinks[sub] = sub_tip[0]
+        if gitlinks:
+            tree = objects.rev_parse('%s^{tree}' % tip)
+            new_tree, err = replace_gitlinks(tree, gitlinks)
+            if err is not None:
+                return None, err
+            if new_tree != tree:
+                tip, err = gitcmd(['commit-tree', new_tree, '-p', tip, '-m', self.SUBMODULES_MESSAGE])
+                if err is not None:
+                    return None, err
+                landed.append('submodules')
+        self.tips[repo] = (tip, landed)
+        if not landed:
+            return None, None
+        return "%s: %s" % (tip, ", ".join(landed)), None
+
+    def __call__(self):
+        """
+        Build the trains of all the repositories, children first so superprojects point at their submodules' trains
+        """
+        return recurse_submodules(self.build, post_traversal=True, concurrent=True)
+
+    def push(self, branch='master'):
+        tip = self.tips.get(os.path.abspath(work_dir()))
+        if tip is None or not tip[1]:
+            return None, None
+        return push(branch, source=tip[0])
+
 
 class FixRefs(object):
-    METHOD = 'fix-refs'
     DOC = "Fix submodule references recursively"
 
     @classmethod
@@ -556,15 +1933,12 @@ class FixRefs(object):
     def __call__(self):
 
         def fix_refs():
-            subs = get_submodules()
-            if subs is None:
-                return None, "no submodules?"
             gitstatus = status()
             if gitstatus is None:
                 return None, "no status?"
             added = []
-            for sub in subs:
-                if sub in gitstatus.modified:
+            for sub in sorted(gitstatus.submodules):
+                if sub in gitstatus.modified and not modules.is_module_excluded(sub):
                     gitcmd(['add', sub])
                     added.append(sub)
             if len(added) > 0:
@@ -572,15 +1946,15 @@ class FixRefs(object):
                 return gitcmd(['commit', '-nm', 'lobo: Updating submodule references'])
             return None, None
 
-        return recurse_submodules(fix_refs, post_traversal=True)
+        return recurse_submodules(fix_refs, post_traversal=True, concurrent=True)
 
 
 class Cleanup(object):
-    METHOD = 'cleanup'
     DOC = 'Delete merged branches across the project. Will only delete merged branches older than 45 days'
 
-    PROTECTED = ['master', 'origin/master', '* master', '*', '->', 'HEAD', 'origin/HEAD']
+    PROTECTED = ['master', 'HEAD']
     DISCARD_AGE_DAYS = 45
+    DELETE_BATCH_SIZE = 500
 
     dry_run = False
     @classmethod
@@ -616,16 +1990,12 @@ class Cleanup(object):
 
     def delete_merged_local(self):
         printp('Deleting merged local branches...')
-        branches, _ = gitcmd(['branch', '--no-color', '--merged', 'origin/master'])
-        branch_list = branches.split('\n')
-        branch_list = map(str.strip, branch_list)
-        branch_list = [x.strip() for x in branch_list if (x not in self.PROTECTED and not '*' in x)]
-        deleted_branches = list()
-        for branch in branch_list:
-            if self.should_delete(branch):
-                deleted_branches.append(branch)
-                if not self.dry_run:
-                    gitcmd(['branch', '-d', branch])
+        current_branch = get_current_branch()
+        deleted_branches = [branch for branch, branch_date in self.merged_branches('refs/heads/')
+                            if branch != current_branch and self.should_delete(branch, branch_date)]
+        if not self.dry_run:
+            for batch in self.batches(deleted_branches):
+                gitcmd(['branch', '-d'] + batch)
 
         return deleted_branches
 
@@ -633,67 +2003,95 @@ class Cleanup(object):
         printp("Deleting local refs to remote branches that don't exist...")
         gitcmd(['remote', 'prune', 'origin'])
         printp('Deleting merged remote branches...')
-        branches, _ = gitcmd(['branch', '-r', '--no-color', '--merged', 'origin/master'])
-        branch_list = branches.split()
-        branch_list = map(str.strip, branch_list)
-        if branch_list:
-            branch_list = [x.strip() for x in branch_list if (x not in self.PROTECTED and not '*' in x)]
-
-        deleted_branches = list()
-        trimmed_branches = list()
-        for branch in branch_list:
-            if self.should_delete(branch):
-                deleted_branches.append(branch)
-                split = branch.split('/')
-                trimmed_branches.append(split[1])
+        trimmed_branches = [branch for branch, branch_date in self.merged_branches('refs/remotes/origin/')
+                            if self.should_delete(branch, branch_date)]
 
         if not self.dry_run:
-            gitcmd(['push', 'origin', '--delete'] + trimmed_branches)
-        return deleted_branches
-
-    def should_delete(self, branch):
-        split = branch.split('/')
-        branch_name = branch if len(split) < 2 else split[1]
-        branch_date = self.get_changed_date(branch)
+            for batch in self.batches(trimmed_branches):
+                gitcmd(['push', 'origin', '--delete'] + batch)
+        return ['origin/' + branch for branch in trimmed_branches]
+
+    def merged_branches(self, prefix):
+        """
+        List all the branches under prefix that are merged with origin/master, in a single for-each-ref pass
+        :return: a list of (branch name without prefix, committer timestamp)
+        """
+        ret, _ = gitcmd(['for-each-ref', '--merged', 'origin/master',
+                         '--format=%(refname) %(committerdate:raw) %(symref)', prefix])
+        if not ret:
+            return []
+        branches = []
+        for line in ret.split('\n'):
+            parts = line.split()
+            if len(parts) > 3:
+                # symbolic refs (origin/HEAD) are listed with their target's date, but aren't branches of their own
+                continue
+            branches.append((parts[0][len(prefix):], int(parts[1])))
+        return branches
+
+    def batches(self, branches):
+        for i in range(0, len(branches), self.DELETE_BATCH_SIZE):
+            yield branches[i:i + self.DELETE_BATCH_SIZE]
+
+    def should_delete(self, branch_name, branch_date):
         branch_age = (datetime.datetime.now() - datetime.datetime.fromtimestamp(branch_date)).days
 
         return branch_age > self.DISCARD_AGE_DAYS and \
+               branch_name not in self.PROTECTED and \
                not branch_name.startswith('rc')
 
-    def get_changed_date(self, branch):
-        if 'detached' in branch:
-            print branch
-        branch_date_string = gitcmd(['show', '-1', '--pretty=%ct', branch])[0]
-        changed_date = int(branch_date_string.split('\n')[0])
-        return changed_date
-
 class Tag(object):
-    METHOD = 'tag'
     DOC = 'Add git tags for all modules'
 
     @classmethod
     def setup_argparser(cls, parser):
-        parser.add_argument("tag_name", help="tag")
-        parser.add_argument("-d", help="delete tag", action="store_true", dest="delete_flag")
+        parser.add_argument("tag_names", nargs='+', help="tags")
+        parser.add_argument("-d", help="delete tags", action="store_true", dest="delete_flag")
 
     def handle(self, namespace):
-        self(namespace.tag_name, namespace.delete_flag)
+        self(namespace.tag_names, namespace.delete_flag)
+
+    def __call__(self, tag_names, delete_flag=False):
+        if isinstance(tag_names, basestring):
+            tag_names = [tag_names]
+        # repository -> seconds its push took
+        timings = {}
 
-    def __call__(self, tag_name, delete_flag):
         def tag():
+            for tag_name in tag_names:
+                if delete_flag:
+                    gitcmd(['tag', '-d', tag_name])
+                else:
+                    ret, err = gitcmd(['tag', tag_name])
+                    if err is not None:
+                        return ret, err
+            return None, None
+
+        def push_tags():
+            # all the tags of a repository go in a single push (a single ssh handshake)
             if delete_flag:
-                gitcmd(['tag', '-d', tag_name])
-                ret = gitcmd(['push', '--delete', 'origin', tag_name])
+                args = ['push', '--delete', 'origin'] + tag_names
             else:
-                gitcmd(['tag', tag_name])
-                ret = push(tag_name)
-
+                args = ['push', '--no-verify', 'origin'] + ['refs/tags/{0}:refs/tags/{0}'.format(t) for t in tag_names]
+            started = time.time()
+            ret = gitcmd(args)
+            timings[relative_submodule(os.path.abspath(work_dir()))] = time.time() - started
             return ret
 
-        return resolve_errors(recurse_submodules(tag), 'Pushing tag...')
+        if not resolve_errors(recurse_submodules(tag, concurrent=True), 'Tagging...'):
+            return False
+        ret = resolve_errors(recurse_submodules(push_tags, concurrent=True), 'Pushing tags...')
+        for repo, seconds in sorted(timings.items(), key=lambda x: x[1], reverse=True):
+            print "%6.2fs %s" % (seconds, repo)
+        return ret
 
 
 def resolve_errors(gen, title=None, errorMsg=None, errorHandling=None):
+    with span(title.strip() if title is not None else 'resolve-errors', 'phase'):
+        return _resolve_errors(gen, title, errorMsg, errorHandling)
+
+
+def _resolve_errors(gen, title, errorMsg, errorHandling):
     printed = False
     error = False
     if title is not None:
@@ -720,11 +2118,11 @@ def resolve_errors(gen, title=None, errorMsg=None, errorHandling=None):
     return not error
 
 def git_tool_entry():
-    parser = ToolkitBase([TreeRoot, CompareBranches, RecurseSubmodules,
-                          GetRemote, NewBranch, CheckoutRemote, GetCurrentBranch,
-                          RebaseIfNeeded, Squash, Push, FixRefs, GetRepo, Tag, Cleanup])
+    parser = ToolkitBase(command_registry.GIT)
     parser.parse()
 
+fetch = FetchPlanner()
+plan_fetch = fetch.plan
 tree_root = TreeRoot()
 compare_branches = CompareBranches()
 recurse_submodules = RecurseSubmodules()
@@ -742,7 +2140,5 @@ cleanup = Cleanup()
 git_config = GitConfig()
 tag = Tag()
 
-verbose = configuration.get_config('git-tool.verbose')
-
 if __name__ == "__main__":
     git_tool_entry()
@@ -39,7 +39,6 @@ def get_hipchat_user():
 
 
 class SendMessage(object):
-    METHOD = "send-message"
     DOC = "Sends a message to a user/room"
 
     @classmethod
@@ -70,7 +69,6 @@ class SendMessage(object):
 
 
 class TestConnection(object):
-    METHOD = "test-connection"
     DOC = "Test the hipchat server connection"
 
     @classmethod
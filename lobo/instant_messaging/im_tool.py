@@ -1,17 +1,22 @@
-from lobo import configuration, nop_driver
+from lobo import command_registry, configuration, nop_driver
+from lobo.lazy_driver import LazyDriver, LazyCommand
+from lobo.toolkit_base import ToolkitBase
 
-im_tool = configuration.get_config('driver:im')
-if im_tool == 'hipchat':
-    import hipchat_tool as im_driver
-else:
-    im_driver = nop_driver.NopDriver()
+
+def load_driver():
+    if configuration.get_config('driver:im') == 'hipchat':
+        import hipchat_tool
+        return hipchat_tool
+    return nop_driver.NopDriver()
+
+im_driver = LazyDriver(load_driver)
 
 def tool_entry():
-    parser = ToolkitBase([im_driver.TestConnection, im_driver.SendMessage])
+    parser = ToolkitBase(command_registry.IM)
     parser.parse()
 
-send_message = im_driver.SendMessage()
-test_connection = im_driver.TestConnection()
+send_message = LazyCommand(im_driver, 'SendMessage')
+test_connection = LazyCommand(im_driver, 'TestConnection')
 
 if __name__ == "__main__":
     tool_entry()
@@ -1,52 +1,101 @@
-from lobo import configuration, nop_driver
+import sys
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
-issue_tracker_tool = configuration.get_config('driver:issue_tracker')
-if issue_tracker_tool == 'jira':
-    import jira_tool as issue_tracker_driver
-else:
-    issue_tracker_driver = nop_driver.NopDriver()
+from lobo import command_registry, configuration, nop_driver
+from lobo.common import BOLD, RED
+from lobo.lazy_driver import LazyDriver, LazyCommand
+from lobo.toolkit_base import ToolkitBase
+from lobo.tracing import span
+
+DEFAULT_WORKERS = 8
+
+
+def load_driver():
+    if configuration.get_config('driver:issue_tracker') == 'jira':
+        import jira_tool
+        return jira_tool
+    return nop_driver.NopDriver()
+
+issue_tracker_driver = LazyDriver(load_driver)
 
 def tool_entry():
-    parser = ToolkitBase([issue_tracker_driver.TestConnection,
-                          issue_tracker_driver.NewIssue,
-                          issue_tracker_driver.CommentIssue,
-                          issue_tracker_driver.Search,
-                          issue_tracker_driver.StartProgress,
-                          issue_tracker_driver.StopProgress,
-                          issue_tracker_driver.ResolveIssue,
-                          issue_tracker_driver.SendToCR,
-                          issue_tracker_driver.SendToQA,
-                          issue_tracker_driver.LandIssue,
-                          issue_tracker_driver.MarkInRC,
-                          issue_tracker_driver.Reopen,
-                          issue_tracker_driver.Reject,
-                          issue_tracker_driver.AbortIssue,
-                          issue_tracker_driver.GetInRC,
-                          issue_tracker_driver.GetOpenIssues,
-                          issue_tracker_driver.GetIssuesToReview,
-                          issue_tracker_driver.GetBlockerBugsToDo])
+    parser = ToolkitBase(command_registry.ISSUE_TRACKER)
     parser.parse()
 
 
-test_connection       = issue_tracker_driver.TestConnection()
-new_issue             = issue_tracker_driver.NewIssue()
-comment_issue         = issue_tracker_driver.CommentIssue()
-start_progress        = issue_tracker_driver.StartProgress()
-stop_progress         = issue_tracker_driver.StopProgress()
-send_to_cr            = issue_tracker_driver.SendToCR()
-send_to_qa            = issue_tracker_driver.SendToQA()
-resolve_issue         = issue_tracker_driver.ResolveIssue()
-land                  = issue_tracker_driver.LandIssue()
-mark_in_rc            = issue_tracker_driver.MarkInRC()
-get_in_rc             = issue_tracker_driver.GetInRC()
-mark_as_released      = issue_tracker_driver.MarkAsReleased()
-reopen                = issue_tracker_driver.Reopen()
-reject                = issue_tracker_driver.Reject()
-abort                 = issue_tracker_driver.AbortIssue()
-search                = issue_tracker_driver.Search()
-get_open_issues       = issue_tracker_driver.GetOpenIssues()
-get_issues_to_review  = issue_tracker_driver.GetIssuesToReview()
-get_blocker_bugs_todo = issue_tracker_driver.GetBlockerBugsToDo()
+TransitionResult = namedtuple('TransitionResult', 'key success error duration')
+
+
+def get_workers():
+    return int(configuration.get_config_or_default('issue-tracker.workers', DEFAULT_WORKERS))
+
+
+def transition_issues(transition, keys, description):
+    """
+    Run a transition on many issues at once, on a bounded pool so the issue tracker isn't flooded
+    :param transition: called with each key, e.g. land or lambda key: mark_in_rc(key, pulse)
+    :return: a TransitionResult for each key, in order
+    """
+    def run(key):
+        started = time.time()
+        try:
+            with span('%s: %s' % (description, key), 'issue'):
+                success = transition(key) is not False
+            error = None if success else 'failed'
+        except Exception as e:
+            success, error = False, getattr(e, 'text', None) or str(e)
+        except BaseException:
+            # SystemExit or KeyboardInterrupt: the pool would drop it and never return, end the command instead
+            return sys.exc_info()
+        return TransitionResult(key, success, error, time.time() - started)
+
+    if not keys:
+        return []
+    pool = ThreadPool(processes=max(1, min(len(keys), get_workers())))
+    try:
+        results = pool.map(run, keys)
+    finally:
+        pool.close()
+        pool.join()
+    for result in results:
+        if not isinstance(result, TransitionResult):
+            raise result[0], result[1], result[2]
+    return results
+
+
+def print_transition_report(results, description):
+    for result in results:
+        if result.success:
+            print "%-12s %-8s %6.2fs" % (result.key, 'ok', result.duration)
+        else:
+            print RED("%-12s %-8s %6.2fs %s" % (result.key, 'FAILED', result.duration, result.error))
+    failed = len([result for result in results if not result.success])
+    print BOLD("%d of %d issues %s, %d failed, %.2fs in JIRA" %
+               (len(results) - failed, len(results), description, failed,
+                sum(result.duration for result in results)))
+
+
+test_connection       = LazyCommand(issue_tracker_driver, 'TestConnection')
+new_issue             = LazyCommand(issue_tracker_driver, 'NewIssue')
+comment_issue         = LazyCommand(issue_tracker_driver, 'CommentIssue')
+start_progress        = LazyCommand(issue_tracker_driver, 'StartProgress')
+stop_progress         = LazyCommand(issue_tracker_driver, 'StopProgress')
+send_to_cr            = LazyCommand(issue_tracker_driver, 'SendToCR')
+send_to_qa            = LazyCommand(issue_tracker_driver, 'SendToQA')
+resolve_issue         = LazyCommand(issue_tracker_driver, 'ResolveIssue')
+land                  = LazyCommand(issue_tracker_driver, 'LandIssue')
+mark_in_rc            = LazyCommand(issue_tracker_driver, 'MarkInRC')
+get_in_rc             = LazyCommand(issue_tracker_driver, 'GetInRC')
+mark_as_released      = LazyCommand(issue_tracker_driver, 'MarkAsReleased')
+reopen                = LazyCommand(issue_tracker_driver, 'Reopen')
+reject                = LazyCommand(issue_tracker_driver, 'Reject')
+abort                 = LazyCommand(issue_tracker_driver, 'AbortIssue')
+search                = LazyCommand(issue_tracker_driver, 'Search')
+get_open_issues       = LazyCommand(issue_tracker_driver, 'GetOpenIssues')
+get_issues_to_review  = LazyCommand(issue_tracker_driver, 'GetIssuesToReview')
+get_blocker_bugs_todo = LazyCommand(issue_tracker_driver, 'GetBlockerBugsToDo')
 
 if __name__ == "__main__":
     tool_entry()
@@ -1,10 +1,14 @@
+import hashlib
+import json
 import os
 import re
 import sys
+import tempfile
+import threading
 import configuration
 from configuration import get_config
 
-from common import YELLOW
+from common import YELLOW, TEMP_DIR
 
 from toolkit_base import ToolkitBase
 
@@ -55,26 +59,141 @@ def get_jira_password():
 
 jira_server = None
 jira_server_config = ''
+# transitions run on a pool, the first ones mustn't all log in at once
+jira_server_lock = threading.Lock()
 
 def get_jira_server():
     global jira_server, jira_server_config
     if jira_server != None:
         return jira_server
-    jira_server_config = get_config('jira.server')
-    user = get_jira_username()
-    password = get_jira_password()
-    try:
-        options = {'server': jira_server_config}
-        jira_server = JIRA(options, basic_auth=(user, password))  # a username/password tuple
-    except jira.exceptions.JIRAError as e:
-        print
-        print CONNECTION_ERROR_MSG
-        print e
-        print
-        sys.exit(1)
+    with jira_server_lock:
+        if jira_server != None:
+            return jira_server
+        jira_server_config = get_config('jira.server')
+        user = get_jira_username()
+        password = get_jira_password()
+        try:
+            options = {'server': jira_server_config}
+            jira_server = JIRA(options, basic_auth=(user, password))  # a username/password tuple
+        except jira.exceptions.JIRAError as e:
+            print
+            print CONNECTION_ERROR_MSG
+            print e
+            print
+            sys.exit(1)
     return jira_server
 
 
+# the fields lobo reads, issues are fetched with just these
+ISSUE_FIELDS = ['summary', 'status', 'assignee', 'project', 'issuetype', CUSTOM_FIELD_REVIEWER, CUSTOM_FIELD_TESTER]
+
+
+class IssueCache(object):
+    """
+    The issues a command looked at, so each is fetched once. Comments are only fetched for whoever asks for them.
+    Transitions and updates drop the issue, the next lookup fetches it again
+    """
+    def __init__(self):
+        self.issues = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, comments=False):
+        key = key.upper()
+        with self.lock:
+            cached = self.issues.get(key)
+        if cached is not None and (cached[1] or not comments):
+            return cached[0]
+        fields = ISSUE_FIELDS + ['comment'] if comments else ISSUE_FIELDS
+        issue = get_jira_server().issue(key, fields=','.join(fields))
+        self.add(issue, comments)
+        return issue
+
+    def add(self, issue, comments=False):
+        with self.lock:
+            self.issues[issue.key.upper()] = (issue, comments)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.issues.pop(key.upper(), None)
+
+
+issue_cache = IssueCache()
+
+
+def get_issue(issue, comments=False):
+    """
+    :param issue: an issue key, or an issue that was already fetched
+    """
+    if type(issue) is Issue:
+        return issue
+    return issue_cache.get(issue, comments)
+
+
+def invalidate_issue(issue):
+    issue_cache.invalidate(issue if not type(issue) is Issue else issue.key)
+
+
+class TransitionIdCache(object):
+    """
+    Transition ids by project, issue type, status and transition name, kept across runs,
+    so a transition doesn't have to look them up first
+    """
+    VERSION = 1
+
+    def __init__(self):
+        self.ids = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def cache_file():
+        key = hashlib.md5(jira_server_config or '').hexdigest()[:8]
+        return os.path.join(TEMP_DIR, 'lobo-jira-transitions-%d-%s.json' % (os.getuid(), key))
+
+    @staticmethod
+    def issue_key(issue):
+        return '|'.join([issue.fields.project.key, issue.fields.issuetype.name, issue.fields.status.name])
+
+    def load(self):
+        if self.ids is not None:
+            return
+        try:
+            with open(self.cache_file()) as f:
+                cache = json.load(f)
+            self.ids = cache['ids'] if cache.get('version') == self.VERSION else {}
+        except (IOError, OSError, ValueError, KeyError, AttributeError):
+            self.ids = {}
+
+    def save(self):
+        filename = self.cache_file()
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=os.path.basename(filename))
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': self.VERSION, 'ids': self.ids}, f)
+            os.rename(tmp, filename)
+        except (IOError, OSError):
+            pass  # it's only a cache
+
+    def get(self, issue, name):
+        with self.lock:
+            self.load()
+            return self.ids.get(self.issue_key(issue), {}).get(name)
+
+    def add(self, issue, transitions):
+        with self.lock:
+            self.load()
+            self.ids[self.issue_key(issue)] = dict((t['name'], t['id']) for t in transitions)
+            self.save()
+
+    def forget(self, issue):
+        with self.lock:
+            self.load()
+            if self.ids.pop(self.issue_key(issue), None) is not None:
+                self.save()
+
+
+transition_ids = TransitionIdCache()
+
+
 def get_issue_url(issue_id):
     return '/'.join((jira_server_config, 'browse', issue_id))
 
@@ -114,14 +233,13 @@ def process_message(message, labels=[]):
 
 def validate_issue(key):
     try:
-        return get_jira_server().issue(key)
+        return get_issue(key)
     except jira.exceptions.JIRAError:
         return None
 
 
 def get_assignee(issue):
-    if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
+    issue = get_issue(issue)
 
     if issue and issue.fields.assignee:
         return issue.fields.assignee.name
@@ -130,8 +248,7 @@ def get_assignee(issue):
 
 
 def get_reviewer(issue):
-    if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
+    issue = get_issue(issue)
 
     if issue:
         return getattr(issue.fields, CUSTOM_FIELD_REVIEWER).name
@@ -139,16 +256,20 @@ def get_reviewer(issue):
         return None
 
 
-def set_reviewer(issue, username):
-    if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
+def update_issue(issue, fields):
+    issue = get_issue(issue)
+    try:
+        return issue.update(fields=fields)
+    finally:
+        invalidate_issue(issue)
 
-    return issue.update(fields={CUSTOM_FIELD_REVIEWER: {'name': username}})
+
+def set_reviewer(issue, username):
+    return update_issue(issue, {CUSTOM_FIELD_REVIEWER: {'name': username}})
 
 
 def get_tester(issue):
-    if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
+    issue = get_issue(issue)
 
     if issue:
         tester = getattr(issue.fields, CUSTOM_FIELD_TESTER).name
@@ -158,24 +279,17 @@ def get_tester(issue):
 
 
 def set_tester(issue, username):
-    if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
-
-    return issue.update(fields={CUSTOM_FIELD_TESTER: {'name': username}})
+    return update_issue(issue, {CUSTOM_FIELD_TESTER: {'name': username}})
 
 
 def get_summary(issue):
-    if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
+    issue = get_issue(issue)
 
     return issue.fields.summary
 
 
 def set_pulse(issue, name):
-    if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
-
-    return issue.update(fields={CUSTOM_FIELD_PULSE: name})
+    return update_issue(issue, {CUSTOM_FIELD_PULSE: name})
 
 
 def get_link(issue):
@@ -185,7 +299,7 @@ def get_link(issue):
 
 def get_latest_build(issue):
     if not type(issue) is Issue:
-        issue = get_jira_server().issue(issue)
+        issue = get_issue(issue, comments=True)
         for comment in reversed(issue.fields.comment.comments):
             if comment.raw['author']['displayName'] == "Builder Builderson":  #and
                 body = (comment.raw['body']).replace('[Download Link|','').replace(']','')
@@ -193,7 +307,6 @@ def get_latest_build(issue):
 
 
 class TestConnection(object):
-    METHOD = 'test-connection'
     DOC = 'Test your settings'
 
     @classmethod
@@ -209,7 +322,6 @@ class TestConnection(object):
 
 
 class NewIssue(object):
-    METHOD = 'new-issue'
     DOC = 'Create a new issue'
 
     @classmethod
@@ -260,11 +372,15 @@ class JiraTransition(object):
         ret = self(namespace.key)
         print ret
 
-    def __call__(self, key):
-        server = get_jira_server()
-        issue = server.issue(key)
+    def __call__(self, key, fields=None):
+        """
+        :param fields: fields to set along with the transition
+        """
+        issue = get_issue(key)
 
         if issue.fields.status.name == self.FINAL_STATUS:
+            if fields:
+                update_issue(issue, fields)
             print 'status is up to date'
             return True
 
@@ -272,22 +388,46 @@ class JiraTransition(object):
         if not permission:
             print YELLOW('WARNING: {0}'.format(warning))
 
-        transitions = server.transitions(issue)
-        transition_id = None
+        transition_id, cached = self.get_transition_id(issue)
+        try:
+            self.transition(issue, transition_id, fields)
+        except jira.exceptions.JIRAError:
+            if not cached and not fields:
+                raise
+            # the cached id went stale, or the transition's screen doesn't take the fields
+            transition_ids.forget(issue)
+            if fields:
+                update_issue(issue, fields)
+            transition_id, _ = self.get_transition_id(issue)
+            self.transition(issue, transition_id)
+        return True
+
+    def get_transition_id(self, issue):
+        """
+        :return: (transition id, whether it came from the cache)
+        """
+        transition_id = transition_ids.get(issue, self.TRANSITION)
+        if transition_id is not None:
+            return transition_id, True
+
+        transitions = get_jira_server().transitions(issue)
+        transition_ids.add(issue, transitions)
         for t in transitions:
             if t['name'] == self.TRANSITION:
-                transition_id = t['id']
+                return t['id'], False
 
-        if transition_id is None:
-            valid = ", ".join([t['name'] for t in transitions])
-            raise jira.exceptions.JIRAError(
-                text='Not a valid transition: \'{0}\' choose one of [{1}]'.format(self.TRANSITION, valid))
-        else:
-            if self.RESOLUTION:
-                server.transition_issue(key, transition_id, resolution={'id': self.RESOLUTION})
-            else:
-                server.transition_issue(key, transition_id)
-            return True
+        valid = ", ".join([t['name'] for t in transitions])
+        raise jira.exceptions.JIRAError(
+            text='Not a valid transition: \'{0}\' choose one of [{1}]'.format(self.TRANSITION, valid))
+
+    def transition(self, issue, transition_id, fields=None):
+        fields = dict(fields or {})
+        if self.RESOLUTION:
+            fields['resolution'] = {'id': self.RESOLUTION}
+        try:
+            get_jira_server().transition_issue(issue.key, transition_id, fields=fields)
+        finally:
+            invalidate_issue(issue)
 
 
 class JiraTransitions(object):
@@ -347,21 +487,18 @@ def is_reviewer(issue):
 
 class Reopen(JiraTransition):
     DOC = 'Reopen an issue'
-    METHOD = 'reopen'
     TRANSITION = JiraTransitions.REOPEN
     FINAL_STATUS = JiraStatus.REOPENED
 
 
 class Reject(JiraTransition):
     DOC = 'Reject an issue, returns to "In Progress"'
-    METHOD = 'reject'
     TRANSITION = JiraTransitions.REJECT
     FINAL_STATUS = JiraStatus.IN_PROGRESS
 
 
 class StartProgress(JiraTransition):
     DOC = 'Start working on an issue'
-    METHOD = 'start-progress'
     TRANSITION = JiraTransitions.START_PROGRESS
     FINAL_STATUS = JiraStatus.IN_PROGRESS
 
@@ -372,7 +509,6 @@ class StartProgress(JiraTransition):
 
 class StopProgress(JiraTransition):
     DOC = 'Stop working on an issue'
-    METHOD = 'stop-progress'
     TRANSITION = JiraTransitions.STOP_PROGRESS
     FINAL_STATUS = JiraStatus.NEW
 
@@ -383,7 +519,6 @@ class StopProgress(JiraTransition):
 
 class SendToCR(JiraTransition):
     DOC = 'Request code review'
-    METHOD = 'request-cr'
     TRANSITION = JiraTransitions.SENT_TO_CODE_REVIEW
     FINAL_STATUS = JiraStatus.IN_CODE_REVIEW
 
@@ -401,12 +536,10 @@ class SendToCR(JiraTransition):
         print ret
 
     def __call__(self, key, reviewer):
-        set_reviewer(key, reviewer)
-        return super(SendToCR, self).__call__(key)
+        return super(SendToCR, self).__call__(key, {CUSTOM_FIELD_REVIEWER: {'name': reviewer}})
 
 
 class SendToQA(JiraTransition):
-    METHOD = 'start-testing'
     DOC = 'Start testing on a feature branch'
     TRANSITION = JiraTransitions.SEND_TO_QA
     FINAL_STATUS = JiraStatus.IN_QA
@@ -418,7 +551,6 @@ class SendToQA(JiraTransition):
 
 class ResolveIssue(JiraTransition):
     DOC = 'Resolve an issue'
-    METHOD = 'resolve-issue'
     TRANSITION = JiraTransitions.RESOLVE
     RESOLUTION = JiraResolution.FIXED
     FINAL_STATUS = JiraStatus.RESOLVED
@@ -426,7 +558,6 @@ class ResolveIssue(JiraTransition):
 
 class AbortIssue(JiraTransition):
     DOC = 'Abort an issue'
-    METHOD = 'abort-issue'
     TRANSITION = JiraTransitions.ABORT
     RESOLUTION = JiraResolution.WONT_FIX
     FINAL_STATUS = JiraStatus.ABORTED
@@ -434,14 +565,12 @@ class AbortIssue(JiraTransition):
 
 class LandIssue(JiraTransition):
     DOC = 'Mark issue as landed'
-    METHOD = 'land'
     TRANSITION = JiraTransitions.LAND
     FINAL_STATUS = JiraStatus.LANDED_IN_MASTER
 
 
 class MarkInRC(JiraTransition):
     DOC = 'Mark an issue as in RC'
-    METHOD = 'in-rc'
     TRANSITION = JiraTransitions.WRAP_RC
     FINAL_STATUS = JiraStatus.IN_RC
 
@@ -455,13 +584,11 @@ class MarkInRC(JiraTransition):
         print ret
 
     def __call__(self, key, pulse):
-        set_pulse(key, pulse)
-        return super(MarkInRC, self).__call__(key)
+        return super(MarkInRC, self).__call__(key, {CUSTOM_FIELD_PULSE: pulse})
 
 
 class GetInRC():
     DOC = 'Get all the issues currently in RC'
-    METHOD = 'get-in-rc'
 
     @classmethod
     def setup_argparser(cls, parser):
@@ -487,7 +614,6 @@ class GetInRC():
 
 class MarkAsReleased(JiraTransition):
     DOC = 'Mark an issue as Released'
-    METHOD = 'release'
     TRANSITION = JiraTransitions.RELEASE
     FINAL_STATUS = JiraStatus.RELEASED
     FINAL_STATUS = JiraStatus.RESOLVED
@@ -506,7 +632,6 @@ class MarkAsReleased(JiraTransition):
 # /transitions
 
 class CommentIssue(object):
-    METHOD = 'comment-issue'
     DOC = 'Add a comment in an issue'
 
     @classmethod
@@ -521,10 +646,10 @@ class CommentIssue(object):
     def __call__(self, key, comment):
         server = get_jira_server()
         server.add_comment(key, comment)
+        invalidate_issue(key)
 
 
 class Search(object):
-    METHOD = 'search'
     DOC = 'Search for issues using a JQL query'
 
     @classmethod
@@ -537,10 +662,12 @@ class Search(object):
 
     def __call__(self, query):
         issues = get_jira_server().search_issues(query)
+        # the transitions that usually follow a search then don't fetch the issues again
+        for issue in issues:
+            issue_cache.add(issue)
         return issues
 
 class GetOpenIssues(object):
-    METHOD = 'get_open_issues'
     DOC = 'Returns all open Jira issues of the user'
 
     @classmethod
@@ -561,7 +688,6 @@ class GetOpenIssues(object):
         return issues
 
 class GetIssuesToReview(object):
-    METHOD = 'get_issues_to_review'
     DOC = 'Returns all issues assigned to review by the user'
 
     @classmethod
@@ -583,7 +709,6 @@ class GetIssuesToReview(object):
 
 
 class GetBlockerBugsToDo(object):
-    METHOD = 'get_blocker_bugs_to_do'
     DOC = 'Returns all issues in status todo which are blocker bugs'
 
     @classmethod
@@ -0,0 +1,87 @@
+import atexit
+import json
+import os
+import threading
+import Queue
+
+from common import TEMP_DIR
+
+"""
+An append only journal of the commands lobo runs, one JSON record per line.
+Records are handed to a writer thread, so journaling stays off the hot path
+"""
+
+JOURNAL_FILE = os.path.join(TEMP_DIR, 'lobo.jsonl')
+MAX_SIZE = 20 * 1024 * 1024
+BACKUPS = 2
+
+# lobo is run from the root of the project, submodules are journaled relative to it
+START_DIR = os.getcwd()
+
+
+class Journal(object):
+    def __init__(self, filename=JOURNAL_FILE, max_size=MAX_SIZE, backups=BACKUPS):
+        self.filename = filename
+        self.max_size = max_size
+        self.backups = backups
+        self.queue = Queue.Queue()
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def record(self, **fields):
+        if self.writer is None:
+            with self.lock:
+                if self.writer is None:
+                    self.writer = threading.Thread(target=self.write_records, name='lobo-journal')
+                    self.writer.daemon = True
+                    self.writer.start()
+        fields['pid'] = os.getpid()
+        self.queue.put(fields)
+
+    def rotate(self):
+        for i in range(self.backups, 0, -1):
+            src = self.filename if i == 1 else '%s.%d' % (self.filename, i - 1)
+            if os.path.exists(src):
+                os.rename(src, '%s.%d' % (self.filename, i))
+
+    def write_records(self):
+        while True:
+            records = [self.queue.get()]
+            # drain whatever piled up meanwhile, so a burst of commands costs a single write
+            while not self.queue.empty():
+                records.append(self.queue.get())
+            done = None in records
+            records = [r for r in records if r is not None]
+            try:
+                if records:
+                    if os.path.exists(self.filename) and os.path.getsize(self.filename) > self.max_size:
+                        self.rotate()
+                    with open(self.filename, 'a') as f:
+                        f.write(''.join(json.dumps(r, sort_keys=True) + '\n' for r in records))
+            except (IOError, OSError):
+                pass  # the journal must never fail a command
+            if done:
+                return
+
+    def after_fork(self):
+        """
+        The writer thread doesn't survive a fork, the child starts its own
+        """
+        self.queue = Queue.Queue()
+        self.writer = None
+        self.lock = threading.Lock()
+
+    def close(self):
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
+
+
+def relative_submodule(cwd):
+    submodule = os.path.relpath(cwd, START_DIR)
+    return '.' if submodule == '.' else os.path.join('.', submodule)
+
+
+journal = Journal()
+atexit.register(journal.close)
@@ -0,0 +1,44 @@
+import threading
+
+"""
+Drivers are picked by the configuration and pull in their third-party clients, so they're only loaded once a command
+actually uses them
+"""
+
+
+class LazyDriver(object):
+    def __init__(self, load):
+        self._load = load
+        self._driver = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._driver is None:
+            with self._lock:
+                if self._driver is None:
+                    self._driver = self._load()
+        return self._driver
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class LazyCommand(object):
+    """
+    A driver's command, created on first use
+    """
+    def __init__(self, driver, class_name):
+        self._driver = driver
+        self._class_name = class_name
+        self._command = None
+
+    def get(self):
+        if self._command is None:
+            self._command = getattr(self._driver, self._class_name)()
+        return self._command
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
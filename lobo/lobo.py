@@ -13,7 +13,9 @@ from operator import itemgetter
 from functools import partial
 from distutils import spawn
 from collections import Counter
+from contextlib import contextmanager
 
+import command_registry
 import configuration
 from issue_tracker import issue_tracker_tool
 import git_tool
@@ -26,9 +28,9 @@ from common import BOLD, UNDERLINE, RED, YELLOW, cd, compose
 from git_tool import resolve_errors
 from version import VERSION
 from handling import FETCH_HANDLING, REBASE_HANDLING, APPROVAL_HANDLING, MERGE_HANDLING
+from tracing import span
 
 
-LOG_LINE_BE_LIKE = re.compile(r'^[a-f0-9]{7} (FIXES )?([A-Z]+-\d+): ')
 YES = ['Y', 'y']
 
 
@@ -127,7 +129,8 @@ def is_squashed_branch(branch):
 
 def update_jira(fn, description):
     try:
-        result = fn()
+        with span('JIRA: %s' % description, 'phase'):
+            result = fn()
         message = description if result else 'update failed'
         print BOLD('JIRA:'), message
     except issue_tracker_tool.JIRAError as e:
@@ -138,19 +141,29 @@ def display_uninited_modules_instructions(uninited_modules):
     if uninited_modules:
         print RED('there are non initialized modules, first initialize {}'.format(uninited_modules))
         branch = git_tool.get_current_branch()
-        for module in uninited_modules:
-            module_name = module.split()[1]
+        for module_name in uninited_modules:
             print RED('To init submodule type the following: git submodule update --init {module_name}; ' \
                       'cd {module_name}; ' \
                       'git checkout -b {branch}'.format(module_name=module_name, branch=branch))
 
+@contextmanager
+def isolated_if(isolated, ref):
+    """
+    Run the body in a lobo managed worktree with ref checked out everywhere, when asked to
+    """
+    if isolated:
+        with git_tool.isolated_worktree(ref):
+            yield
+    else:
+        yield
+
+
 def check_root():
     if not git_tool.is_at_root():
         print 'OMG where are we?! are you sure we\'re at the root project dir?'
         exit(-1)
 
 class WorkOn(object):
-    METHOD = 'work-on'
     DOC = 'Switch to an existing branch or tag (aka "checkout-remote")'
 
     @classmethod
@@ -166,7 +179,7 @@ class WorkOn(object):
         if issue_tracker_tool.ISSUE_BE_LIKE.match(target) is None:
             # doesn't look like an issue
             to_fetch = [target]
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(to_fetch)), **FETCH_HANDLING)
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(to_fetch), concurrent=True), **FETCH_HANDLING)
         kind = None
         if all(x[1] for x in git_tool.recurse_submodules(lambda: git_tool.is_remote_branch(target))):
             kind = "branch"
@@ -195,7 +208,6 @@ class WorkOn(object):
 
 
 class NewFeature(object):
-    METHOD = 'new-feature'
     DOC = 'Start working on a new feature / bug / task'
 
     @classmethod
@@ -222,7 +234,7 @@ class NewFeature(object):
             message = issue_tracker_tool.process_message(message, labels)
             summary = message.summary
             key = message.issue
-            issue = issue_tracker_tool.get_jira_server().issue(key)
+            issue = issue_tracker_tool.get_issue(key)
 
         # look for existing branches before creating a new one
         existing_branches = [s for s in git_tool.get_all_branches() if key.replace('-', '').lower() in s]
@@ -244,14 +256,13 @@ class NewFeature(object):
                        title="Checking out master...")
         resolve_errors(git_tool.recurse_submodules(lambda: git_tool.new_branch(branch_name)),
                        title="Creating new branch...")
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.forcepush(branch_name)),
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.forcepush(branch_name), concurrent=True),
                        title="Pushing newly created branches...")
 
         update_jira(partial(issue_tracker_tool.start_progress, key), 'Started progress')
 
 
 class Commit(object):
-    METHOD = 'commit'
     DOC = 'Commit your work across all submodules'
 
     @classmethod
@@ -279,7 +290,6 @@ class Commit(object):
 
 
 class Daily(object):
-    METHOD = 'daily'
     DOC = 'Daily routine - rebase, fix-refs, push, (future: upload new translations)'
 
     @classmethod
@@ -302,16 +312,15 @@ class Daily(object):
             display_uninited_modules_instructions(uninited_modules)
             return
 
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(['master'])), **FETCH_HANDLING)
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(['master']), concurrent=True), **FETCH_HANDLING)
         resolve_errors(git_tool.recurse_submodules(lambda: git_tool.rebase_if_needed('master')), **REBASE_HANDLING)
         resolve_errors(git_tool.fix_refs(), title="Fixing submodule references")
 
         if push:
-            resolve_errors(git_tool.recurse_submodules(git_tool.forcepush), title="Pushing...")
+            resolve_errors(git_tool.recurse_submodules(git_tool.forcepush, concurrent=True), title="Pushing...")
 
 
 class Sync(object):
-    METHOD = 'sync'
     DOC = 'Sync your work with the server'
 
     @classmethod
@@ -329,16 +338,17 @@ class Sync(object):
             return
 
         current_branch = get_current_branch()
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch([current_branch])), **FETCH_HANDLING)
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch([current_branch]), concurrent=True), **FETCH_HANDLING)
         resolve_errors(git_tool.recurse_submodules(lambda: git_tool.rebase_if_needed(current_branch)), **REBASE_HANDLING)
         resolve_errors(git_tool.fix_refs(), title="Fixing submodule references")
-        resolve_errors(git_tool.recurse_submodules(git_tool.push), title="Pushing...")
+        resolve_errors(git_tool.recurse_submodules(git_tool.push, concurrent=True), title="Pushing...")
 
 class RebaseAndBuild(object):
 
     @classmethod
     def setup_argparser(cls, parser):
-        pass
+        parser.add_argument("--isolated", action='store_true', default=False,
+                            help="rebase and squash in a lobo managed worktree, leaving your checkout alone")
 
     def handle(self, namespace):
         ret = self(namespace)
@@ -363,35 +373,28 @@ class RebaseAndBuild(object):
         if uninited_modules:
             display_uninited_modules_instructions(uninited_modules)
             return
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(['master'])), **FETCH_HANDLING)
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.rebase_if_needed('master')), **REBASE_HANDLING)
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(['master']), concurrent=True), **FETCH_HANDLING)
 
-        def get_original_author():
-            if git_tool.is_branch_diverged('origin/master'):
-                authors[git_tool.get_author()] += 1
-
-        list(git_tool.recurse_submodules(get_original_author))
-        author = authors.most_common(1)[0][0] if authors else None
+        isolated = getattr(namespace, 'isolated', False)
+        # in an isolated worktree branch is checked out detached, it's pushed from HEAD
+        source = 'HEAD' if isolated else None
+        with isolated_if(isolated, branch):
+            resolve_errors(git_tool.recurse_submodules(lambda: git_tool.rebase_if_needed('master')), **REBASE_HANDLING)
 
-        def create_squashed_branch():
-            git_tool.gitcmd(['branch', '-f', squashed_branch, branch])
-            return git_tool.gitcmd(['checkout', squashed_branch])
+            def get_original_author():
+                if git_tool.is_branch_diverged('origin/master'):
+                    authors[git_tool.get_author()] += 1
 
-        def squash():
-            ret = err = None
-            if git_tool.is_branch_diverged('origin/master'):
-                ret, err = git_tool.squash(title, author)
-            return ret, err
+            list(git_tool.recurse_submodules(get_original_author))
+            author = authors.most_common(1)[0][0] if authors else None
 
-        def push_and_back():
-            git_tool.gitcmd(['checkout', branch])
-            return git_tool.forcepush(squashed_branch)
-
-        resolve_errors(git_tool.recurse_submodules(git_tool.forcepush), title="Pushing...")
-        resolve_errors(git_tool.recurse_submodules(create_squashed_branch), title="Creating squashed branch...")
-        resolve_errors(git_tool.recurse_submodules(squash), title="Squashing...")
-        resolve_errors(git_tool.fix_refs(), title="Fixing refs...")
-        resolve_errors(git_tool.recurse_submodules(push_and_back), title="Pushing squashed branch...")
+            resolve_errors(git_tool.recurse_submodules(lambda: git_tool.forcepush(branch, source=source),
+                                                       concurrent=True), title="Pushing...")
+            # the squashed branches are written straight into the object store, the checkout stays on branch
+            resolve_errors(git_tool.squash.squash_tree(title, squashed_branch, source or branch, author),
+                           title="Squashing...")
+            resolve_errors(git_tool.recurse_submodules(lambda: git_tool.forcepush(squashed_branch), concurrent=True),
+                           title="Pushing squashed branch...")
 
         self.process(namespace, squashed_branch)
 
@@ -407,11 +410,11 @@ class RebaseAndBuild(object):
 
 
 class Submit(RebaseAndBuild):
-    METHOD = 'submit'
     DOC = 'submit a change to review'
 
     @classmethod
     def setup_argparser(cls, parser):
+        super(Submit, cls).setup_argparser(parser)
         parser.add_argument("assignee", help="who should the MR be assigned to? (username in gitlab)")
 
     def handle(self, namespace):
@@ -426,11 +429,11 @@ class Submit(RebaseAndBuild):
 
 
 class PreLand(RebaseAndBuild):
-    METHOD = 'pre-land'
     DOC = 'rebase and rebuild before landing'
 
     @classmethod
     def setup_argparser(cls, parser):
+        super(PreLand, cls).setup_argparser(parser)
         parser.add_argument("-w", dest="wait", action='store_true', help="wait until the build finishes")
 
     def process(self, namespace, squashed_branch):
@@ -476,7 +479,6 @@ class PostBuild(object):
 
 
 class PostBuildForPreLand(PostBuild):
-    METHOD = 'post-build-pre-land'
     DOC = "Not for mortals!!! This should be init from a Jenkins job once the build is completed successfully, " \
           "will create post build tasks for the 'pre-land' command (update via hipchat on successful build)"
 
@@ -491,7 +493,6 @@ class PostBuildForPreLand(PostBuild):
 
 
 class PostBuildForSubmit(PostBuild):
-    METHOD = 'post-build-submit'
     DOC = "Not for mortals!!! This should be init from a Jenkins job once the build is completed successfully, " \
           "will create post build tasks for the 'submit' command (update jira, create MRs, update via hipchat)"
 
@@ -504,8 +505,10 @@ class PostBuildForSubmit(PostBuild):
         im_tool.send_message(hipchat_assigner, "Build {0} ({1}) is successful, listing MRs... [{2}, {3}]".format(build_number, issue, jenkins_job_url, jira_issue_url))
         im_tool.send_message(hipchat_assignee, "Build {0} ({1}) is successful, MRs are coming your way... [{2}, {3}]".format(build_number, issue, jenkins_job_url, jira_issue_url))
 
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(['master']), concurrent=True),
+                       **FETCH_HANDLING)
+
         def open_mr():
-            git_tool.fetch(['master'])
             if git_tool.is_branch_diverged('origin/master'):
                 mr = cr_tool.create_mr(git_tool.get_repo(), squashed_branch, assignee, "WIP: "+title)
                 cr_tool.approve_build(git_tool.get_repo(), squashed_branch, build_number)
@@ -522,7 +525,6 @@ class PostBuildForSubmit(PostBuild):
                     'Requested code review')
 
 class Test(object):
-    METHOD = 'test'
     DOC = 'test build your branch'
 
     @classmethod
@@ -535,22 +537,19 @@ class Test(object):
     def __call__(self):
         check_root()
         branch = get_current_branch()
-        resolve_errors(git_tool.recurse_submodules(git_tool.forcepush), title="Pushing...")
+        resolve_errors(git_tool.recurse_submodules(git_tool.forcepush, concurrent=True), title="Pushing...")
         print BOLD("Building")
         builder_tool.build_launcher(branch, ["Debug"], False)
 
 
 def issues_not_in_branch(branchname):
-    cmd = 'log --oneline {0}..{1}'.format(branchname, 'origin/master')
-    ret, _ = git_tool.gitcmd(cmd)
-    keys = LOG_LINE_BE_LIKE.findall(ret)
-    keys = set(x[1] for x in keys)
+    ret, _ = git_tool.gitcmd(['rev-list', '{0}..{1}'.format(branchname, 'origin/master')])
+    keys = git_tool.get_issue_index().issues((ret or '').split(), 'origin/master')
 
     return list(keys)
 
 
 class Release(object):
-    METHOD = 'release'
     DOC = 'released all issues in the current RC'
 
     @classmethod
@@ -571,18 +570,16 @@ class Release(object):
             jql = 'project in ({0}) and status="{1}"'.format(project, issue_tracker_tool.JiraStatus.IN_RC)
             issues = issue_tracker_tool.search(jql)
             print "{0} issues found".format(len(issues))
-            keys_in_rc = [issue.key for issue in issues]
+            keys_in_rc = sorted(set(issue.key for issue in issues))
 
-            for key in set(keys_in_rc):
-                print "{0}: marking as released".format(key)
-                issue_tracker_tool.mark_as_released(key)
-            print "Done marking issues as released"
+            results = issue_tracker_tool.transition_issues(issue_tracker_tool.mark_as_released, keys_in_rc,
+                                                           'marked as released')
+            issue_tracker_tool.print_transition_report(results, 'marked as released')
 
         mark_issues_to_released()
         pass  # possibly, in the future add additional automation for release( except for Jira transitions)
 
 class Freeze(object):
-    METHOD = 'freeze'
     DOC = 'freeze a build into an RC branch'
 
     @classmethod
@@ -596,7 +593,7 @@ class Freeze(object):
     def __call__(self, build_no, project="Android,Context,Discovery"):
         check_root()
         tag = "cibuild_%s" % build_no
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch()), **FETCH_HANDLING)
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(), concurrent=True), **FETCH_HANDLING)
 
         # make sure we get the correct week even if we freeze on Sunday
         now = datetime.datetime.now()
@@ -608,7 +605,7 @@ class Freeze(object):
 
         resolve_errors(git_tool.recurse_submodules(lambda: git_tool.new_branch(branchname, tag)),
                        title="Freezing into %s" % branchname)
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.forcepush(branchname)),
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.forcepush(branchname), concurrent=True),
                        title="Pushing %s" % branchname)
 
         def protect():
@@ -629,9 +626,10 @@ class Freeze(object):
             exclude = issues_not_in_branch(branchname)
             print 'excluding issues not in {0}'.format(branchname), exclude
 
-            for key in set(keys_in_master) - set(exclude):
-                print "{0}: marking in rc".format(key)
-                issue_tracker_tool.mark_in_rc(key, branchname)
+            keys = sorted(set(keys_in_master) - set(exclude))
+            results = issue_tracker_tool.transition_issues(lambda key: issue_tracker_tool.mark_in_rc(key, branchname),
+                                                           keys, 'marked in rc')
+            issue_tracker_tool.print_transition_report(results, 'marked in rc')
 
         resolve_errors(git_tool.recurse_submodules(protect), title="Protecting %s" % branchname)
 
@@ -653,87 +651,122 @@ class Freeze(object):
 
 
 class Land(object):
-    METHOD = 'land'
     DOC = 'land a fix into master'
 
     @classmethod
     def setup_argparser(cls, parser):
-        parser.add_argument("what", help="what should be landed (issue/branchname)")
+        parser.add_argument("what", nargs='+',
+                            help="what should be landed (issue/branchname), several are landed as one merge train")
         parser.add_argument("--allow-not-ff", help="allow landing even if target is not rebased with master",
                             action='store_true', default=False, dest='ok_no_ff')
+        parser.add_argument("--isolated", action='store_true', default=False,
+                            help="merge and push from a lobo managed worktree, no need to be on master")
 
     def handle(self, namespace):
-        ret = self(namespace.what, namespace.ok_no_ff)
+        what = namespace.what[0] if len(namespace.what) == 1 else namespace.what
+        ret = self(what, namespace.ok_no_ff, namespace.isolated)
 
-    def __call__(self, what, ok_no_ff):
-        check_root()
+    @staticmethod
+    def plan_fetch(whats):
+        """
+        Land fetches each repository once: master and the branches named outright go along with the first fetch,
+        be it find_branch's full fetch for an issue without a local branch or the fetch of the branches to land
+        """
+        git_tool.plan_fetch(['master'] +
+                            [what for what in whats if issue_tracker_tool.ISSUE_BE_LIKE.match(what) is None])
 
-        if get_current_branch() != 'master':
-            print "You should be on the master branch before landing a feature, sweetie!"
-            return
-        fetched = False
+    def find_branch(self, what):
+        """
+        :return: (issue, branchname) of what should be landed
+        """
         if issue_tracker_tool.ISSUE_BE_LIKE.match(what) is not None:
             issue = what
             branchname = branchname_from_issue(issue, test=True, squashed=True)
             if branchname is None:
-                resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch()), **FETCH_HANDLING)
-                fetched = True
+                resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(), concurrent=True), **FETCH_HANDLING)
                 branchname = branchname_from_issue(what, squashed=True)
         else:
             branchname = what
             issue = issue_from_branchname(what, squashed=True)
         if not is_squashed_branch(branchname):
-            print YELLOW("Warning: landning non-squashed branch!")
+            print YELLOW("Warning: landning non-squashed branch %s!" % branchname)
         if issue is None:
-            print YELLOW("Warning: unknown issue!")
+            print YELLOW("Warning: unknown issue for %s!" % branchname)
+        return issue, branchname
 
-        def is_ready_to_land():
-            if not fetched:
-                git_tool.fetch([branchname, 'master'])
-            if git_tool.is_merged_with("origin/%s" % branchname, ref="origin/master"):
-                return None, None
+    @staticmethod
+    def is_ready_to_land(branchname):
+        landed, rebased = git_tool.are_ancestors([("origin/%s" % branchname, "origin/master"),
+                                                  ("origin/master", "origin/%s" % branchname)])
+        if landed:
+            return None, None
 
-            err = []
-            if not git_tool.is_merged_with("origin/master", ref="origin/%s" % branchname):
-                err.append("Not rebased!")
-            approvals = list(cr_tool.get_signed_comments(git_tool.get_repo(), branchname))
-            body = lambda x: x['body']
-            built = filter(compose(cr_tool.ApproveBuild.filter_message, body), approvals)
-            cr = filter(compose(cr_tool.ApproveCR.filter_message, body), approvals)
-            qa = filter(compose(cr_tool.ApproveQA.filter_message, body), approvals)
-            ui = filter(compose(cr_tool.ApproveUITests.filter_message, body), approvals)
-            probe = filter(compose(cr_tool.ApproveProbeTests.filter_message, body), approvals)
-
-
-            ret = []
-            if len(built) == 0:
-                err.append("Wasn't built!")
-            else:
-                ret.extend('Built by %s at %s' % (x['author']['name'], x['created_at']) for x in built)
-            if len(cr) == 0:
-                err.append("Wasn't reviewed!")
-            else:
-                ret.extend('Reviewd by %s at %s' % (x['author']['name'], x['created_at']) for x in cr)
-            if len(qa) == 0:
-                err.append("Didn't pass QA!")
-            else:
-                ret.extend("Passed QA's %s at %s" % (x['author']['name'], x['created_at']) for x in qa)
-            if len(ui) == 0:
-                err.append("Didn't pass UI tests!")
-            else:
-                ret.extend("Passed UI Tests at %s" % x['created_at'] for x in ui)
-            if len(probe) == 0:
-                err.append("Didn't pass Probe benchmark test")
-            else:
-                ret.extend("Passed Probe benchmark test at %s" % x['created_at'] for x in probe)
+        err = []
+        if not rebased:
+            err.append("Not rebased!")
+        approvals = list(cr_tool.get_signed_comments(git_tool.get_repo(), branchname))
+        body = lambda x: x['body']
+        built = filter(compose(cr_tool.ApproveBuild.filter_message, body), approvals)
+        cr = filter(compose(cr_tool.ApproveCR.filter_message, body), approvals)
+        qa = filter(compose(cr_tool.ApproveQA.filter_message, body), approvals)
+        ui = filter(compose(cr_tool.ApproveUITests.filter_message, body), approvals)
+        probe = filter(compose(cr_tool.ApproveProbeTests.filter_message, body), approvals)
+
+
+        ret = []
+        if len(built) == 0:
+            err.append("Wasn't built!")
+        else:
+            ret.extend('Built by %s at %s' % (x['author']['name'], x['created_at']) for x in built)
+        if len(cr) == 0:
+            err.append("Wasn't reviewed!")
+        else:
+            ret.extend('Reviewd by %s at %s' % (x['author']['name'], x['created_at']) for x in cr)
+        if len(qa) == 0:
+            err.append("Didn't pass QA!")
+        else:
+            ret.extend("Passed QA's %s at %s" % (x['author']['name'], x['created_at']) for x in qa)
+        if len(ui) == 0:
+            err.append("Didn't pass UI tests!")
+        else:
+            ret.extend("Passed UI Tests at %s" % x['created_at'] for x in ui)
+        if len(probe) == 0:
+            err.append("Didn't pass Probe benchmark test")
+        else:
+            ret.extend("Passed Probe benchmark test at %s" % x['created_at'] for x in probe)
+
+        return "\n".join(ret), (None if len(err) == 0 else "\n".join(err))
+
+    @staticmethod
+    def check_open_mr(*branchnames):
+        # Make sure all MR for these issues in gitlab are closed
+        repo = git_tool.get_repo()
+        project = cr_tool.get_project(repo)
+        still_open = [branchname for branchname in branchnames if cr_tool.get_open_mr(project, branchname) is not None]
+        if still_open:
+            print RED("ALERT: merge request is still open in GitLab for {}! ({})".format(repo, ", ".join(still_open)))
+            return None, "ALERT: merge request is still open in GitLab for %s" % ", ".join(still_open)
+        return None, None
+
+    def __call__(self, what, ok_no_ff, isolated=False):
+        check_root()
 
-            return "\n".join(ret), (None if len(err) == 0 else "\n".join(err))
+        if not isolated and get_current_branch() != 'master':
+            print "You should be on the master branch before landing a feature, sweetie!"
+            return
+        if not isinstance(what, basestring):
+            return self.train(what, ok_no_ff, isolated)
+        self.plan_fetch([what])
+        issue, branchname = self.find_branch(what)
 
-        resolve_errors(git_tool.recurse_submodules(is_ready_to_land), **APPROVAL_HANDLING)
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch([branchname]), concurrent=True),
+                       **FETCH_HANDLING)
+
+        resolve_errors(git_tool.recurse_submodules(lambda: self.is_ready_to_land(branchname)), **APPROVAL_HANDLING)
 
 
         def do_push():
-            return git_tool.push('master')
+            return git_tool.push('master', source='HEAD' if isolated else None)
 
         def do_merge():
             ret, err = git_tool.gitcmd(['merge', '--ff' if ok_no_ff else '--ff-only', 'origin/%s' % branchname])
@@ -742,22 +775,15 @@ class Land(object):
 
             return ret, None
 
-        merge_success = resolve_errors(git_tool.recurse_submodules(do_merge), **MERGE_HANDLING)
+        # a worktree of origin/master, the merge is pushed from its detached HEAD
+        with isolated_if(isolated, 'origin/master'):
+            merge_success = resolve_errors(git_tool.recurse_submodules(do_merge), **MERGE_HANDLING)
+            if merge_success:
+                resolve_errors(git_tool.fix_refs(), title="Fixing submodule references")
+                push_success = resolve_errors(git_tool.recurse_submodules(do_push, concurrent=True), title="Pushing...")
         if merge_success:
-            resolve_errors(git_tool.fix_refs(), title="Fixing submodule references")
-            push_success = resolve_errors(git_tool.recurse_submodules(do_push), title="Pushing...")
-
-            # Make sure all MR for this issue in gitlab are closed
-            def check_open_mr():
-                repo = git_tool.get_repo()
-                project = cr_tool.get_project(repo)
-                mr = cr_tool.get_open_mr(project, branchname)
-                if mr is not None:
-                    print RED("ALERT: merge request is still open in GitLab for {}!".format(repo))
-                    return None, "ALERT: merge request is still open in GitLab"
-                return None, None
-
-            gitlab_check_success = resolve_errors(git_tool.recurse_submodules(check_open_mr), title="Checking GitLab status...")
+            gitlab_check_success = resolve_errors(git_tool.recurse_submodules(lambda: self.check_open_mr(branchname)),
+                                                  title="Checking GitLab status...")
             if not gitlab_check_success:
                 print RED("ERROR: there are still open MR in GitLab after land for {}, something is terribly wrong!!".format(issue))
 
@@ -766,8 +792,55 @@ class Land(object):
                 return push_success
         return False
 
+    def train(self, whats, ok_no_ff=False, isolated=False):
+        """
+        Land several issues/branches in one pass: one fetch, the approvals of all of them checked together, each
+        repository's new master built in memory with all the branches on top of each other, and a single push
+        """
+        err = git_tool.MergeTrain.check_git()
+        if err is not None:
+            print RED("ERROR: %s" % err)
+            return False
+        self.plan_fetch(whats)
+        targets = [self.find_branch(what) for what in whats]
+        branchnames = [branchname for _, branchname in targets]
+        issues = [issue for issue, _ in targets if issue is not None]
+
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(branchnames), concurrent=True),
+                       **FETCH_HANDLING)
+
+        def are_ready_to_land():
+            rets, errs = [], []
+            for branchname in branchnames:
+                ret, err = self.is_ready_to_land(branchname)
+                if ret:
+                    rets.append("%s:\n%s" % (UNDERLINE(branchname), ret))
+                if err is not None:
+                    errs.append("%s:\n%s" % (branchname, err))
+            return "\n".join(rets) or None, "\n".join(errs) or None
+
+        resolve_errors(git_tool.recurse_submodules(are_ready_to_land, concurrent=True), **APPROVAL_HANDLING)
+
+        train = git_tool.MergeTrain(["origin/%s" % branchname for branchname in branchnames], ok_no_ff=ok_no_ff)
+        resolve_errors(train(), **dict(MERGE_HANDLING, title="Building the merge train..."))
+        push_success = resolve_errors(git_tool.recurse_submodules(train.push, concurrent=True), title="Pushing...")
+        if not push_success:
+            return False
+        if not isolated:
+            # the pushes moved origin/master, catch the local master up
+            resolve_errors(git_tool.recurse_submodules(lambda: git_tool.gitcmd(['merge', '--ff-only', 'origin/master'])),
+                           title="Updating master...")
+
+        # all the branches in a single walk of the repositories
+        if not resolve_errors(git_tool.recurse_submodules(partial(self.check_open_mr, *branchnames), concurrent=True),
+                              title="Checking GitLab status..."):
+            print RED("ERROR: there are still open MR in GitLab after land, something is terribly wrong!!")
+
+        results = issue_tracker_tool.transition_issues(issue_tracker_tool.land, issues, 'landed in master')
+        issue_tracker_tool.print_transition_report(results, 'landed in master')
+        return push_success
+
 class Backout(object):
-    METHOD = 'backout'
     DOC = 'pick a specific feature/fix to backout from master'
 
     @classmethod
@@ -806,8 +879,11 @@ class Backout(object):
             GIT_LOG_FORMAT = '%x1f'.join(GIT_LOG_FORMAT) + '%x1e'
             REVERT_TEMPLATE = """Revert "{message}"\n\nThis reverts commit {commit}."""
 
-            # ":" is added to issue id to prevent mistakes (--grep AN-xxx:)
-            (log, err) = git_tool.gitcmd(['log', '--grep', issue+':', '--format={}'.format(GIT_LOG_FORMAT)])
+            # the issue's commits and the reverts of them, newest first
+            commits = git_tool.get_issue_index().commits(issue, 'HEAD', reverts=True)
+            if not commits:
+                return None, None
+            (log, err) = git_tool.gitcmd(['log', '--no-walk', '--format={}'.format(GIT_LOG_FORMAT)] + commits)
             if not log:
                 return log, err
             # turn log into a list of dictionaries for for easier use
@@ -824,15 +900,13 @@ class Backout(object):
                     # try reverting
                     revert_ret, revert_err = git_tool.gitcmd(['revert','--no-edit',commit['id']])
 
-                    submodules = None
                     if revert_err is not None:
                         # try resolving submodule reference issues automatically
                         gitstatus = git_tool.status()
-                        if submodules is None:
-                            submodules = git_tool.get_submodules()
-                            if submodules is None:
-                                return ret, err
-                        non_subs = set(gitstatus.conflict) - set(submodules)
+                        if gitstatus is None:
+                            return ret, err
+                        non_subs = set(x for x in gitstatus.conflict
+                                       if not git_tool.is_submodule_conflict(gitstatus, x))
                         if len(non_subs) > 0:
                             print "Conflict in non submodules %r" % non_subs
                             return revert_ret, revert_err
@@ -873,41 +947,59 @@ class Backout(object):
         return ret
 
 class CherryPick(object):
-    METHOD = 'cherry-pick'
-    DOC = 'pick a specific fix into an RC branch'
+    DOC = 'pick specific fixes into an RC branch'
 
     @classmethod
     def setup_argparser(cls, parser):
-        parser.add_argument("issue", help="issue which should be elevated")
+        parser.add_argument("issues", nargs='+', help="issues which should be elevated")
         parser.add_argument("branchname", help="name of RC branch")
 
     def handle(self, namespace):
-        ret = self(namespace.issue, namespace.branchname)
+        ret = self(namespace.issues, namespace.branchname)
 
-    def __call__(self, issue, branchname):
+    def __call__(self, issues, branchname):
+        if isinstance(issues, basestring):
+            issues = [issues]
         check_root()
+        # commits are picked from origin/master, fetch it along with the RC branch
+        git_tool.plan_fetch(['master'])
         work_on(branchname)
 
-        def do_the_cherry():
-            if os.path.exists('.git/CHERRY_PICK_HEAD'):
-                ret, err = git_tool.gitcmd(['cherry-pick', '--allow-empty-message', '--continue'])
+        # repository -> the commits to apply to it, planned for all the issues and submodules before applying any
+        picks = {}
+
+        def plan_the_cherries():
+            if git_tool.get_cherry_pick_step() is not None:
+                ret, err = git_tool.cherry_pick()
                 if err is not None:
                     return ret, err
-            ret, err = git_tool.gitcmd(
-                ['log', '--grep=%s' % issue, '--reverse', '--date-order', '--cherry', '--oneline',
-                 '%s..origin/master' % branchname])
+            index = git_tool.get_issue_index()
+            candidates = set()
+            for issue in issues:
+                candidates.update(index.commits(issue, 'origin/master'))
+            if not candidates:
+                return None, None
+            # leave out commits the RC branch already has an equivalent of
+            commits, err = git_tool.cherry(branchname, 'origin/master', candidates)
             if err is not None:
-                return ret, err
-            commits = [x[1:].split() for x in ret.split('\n') if len(x) > 1]
-            commits = [x[0] for x in commits if len(x) > 0]
-            if len(commits) > 0:
-                print BOLD("applying " + ", ".join(UNDERLINE(x) for x in commits))
-                commits = ['cherry-pick'] + commits
-            else:
+                return None, err
+            if len(commits) == 0:
                 return None, None
-            return git_tool.gitcmd(commits)
+            picks[os.path.abspath(git_tool.work_dir())] = commits
+            return "applying " + ", ".join(UNDERLINE(x) for x in commits), None
 
-        return resolve_errors(git_tool.recurse_submodules(do_the_cherry), title="Cherry Picking...")
+        def do_the_cherry():
+            commits = picks.get(os.path.abspath(git_tool.work_dir()))
+            if not commits:
+                return None, None
+            return git_tool.cherry_pick(commits)
+
+        resolve_errors(git_tool.recurse_submodules(plan_the_cherries, concurrent=True), title="Planning...")
+        ret = resolve_errors(git_tool.recurse_submodules(do_the_cherry, concurrent=True), title="Cherry Picking...")
+        if ret:
+            # submodule pointers are fixed once, after every repository got its commits
+            resolve_errors(git_tool.fix_refs(), title="Fixing refs...")
+        return ret
 
 
 class ApproveGeneric(object):
@@ -923,7 +1015,7 @@ class ApproveGeneric(object):
         return issue_tracker_tool.ISSUE_BE_LIKE.match(what) is not None
 
     def __call__(self, what):
-        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch()), **FETCH_HANDLING)
+        resolve_errors(git_tool.recurse_submodules(lambda: git_tool.fetch(), concurrent=True), **FETCH_HANDLING)
 
         if self.is_issue(what):
             branchname = branchname_from_issue(what, test=True, squashed=True)
@@ -946,7 +1038,6 @@ class ApproveGeneric(object):
 
 
 class ApproveCR(ApproveGeneric):
-    METHOD = 'approve-cr'
     DOC = 'mark an issue as CR approved'
     KIND = "CR"
     APPROVAL_FUNC = cr_tool.approve_cr
@@ -962,7 +1053,6 @@ class ApproveCR(ApproveGeneric):
 
 
 class ApproveQA(ApproveGeneric):
-    METHOD = 'approve-qa'
     DOC = 'mark an issue as QA approved'
     KIND = "QA"
     APPROVAL_FUNC = cr_tool.approve_qa
@@ -975,14 +1065,12 @@ class ApproveQA(ApproveGeneric):
 
 
 class ApproveUITests(ApproveGeneric):
-    METHOD = 'approve-ui-tests'
     DOC = 'mark an issue passed UI tests'
     KIND = "UI-TESTS"
     APPROVAL_FUNC = cr_tool.approve_ui_tests
 
 
 class Reopen(object):
-    METHOD = 'reopen'
     DOC = 'Reopen an issue'
 
     @classmethod
@@ -997,8 +1085,7 @@ class Reopen(object):
 
 
 class RejectCR(object):
-    METHOD = issue_tracker_tool.reject.METHOD + "-cr"
-    DOC = issue_tracker_tool.reject.DOC
+    DOC = 'Reject an issue, returns to "In Progress"'
 
     @classmethod
     def setup_argparser(cls, parser):
@@ -1014,7 +1101,6 @@ class RejectCR(object):
 
 
 class Info():
-    METHOD = 'info'
     DOC = 'prints the current version and running config'
 
     def collect_info(self):
@@ -1034,7 +1120,6 @@ class Info():
 
 
 class CheckConfig():
-    METHOD = 'check-config'
     DOC = 'test your configuration'
 
     @classmethod
@@ -1083,7 +1168,6 @@ def test_hipchat_connection():
 
 
 class Update():
-    METHOD = 'update'
     DOC = 'update lobo'
 
     @classmethod
@@ -1098,7 +1182,6 @@ class Update():
 
 
 class ShowOpenIssues():
-    METHOD = 'show-open-issues'
     DOC = 'Show the open issues of a user in the CurrentWork sprint'
 
     @classmethod
@@ -1129,7 +1212,6 @@ class ShowOpenIssues():
 
 
 class UpdateQA():
-    METHOD = 'update-qa'
     DOC = 'Notifies the QA hipchat room that there\'s a build ready for testing'
 
     @classmethod
@@ -1157,7 +1239,6 @@ class UpdateQA():
 
 
 class Abort():
-    METHOD = 'abort'
     DOC = 'Closes all existing open merge requests and aborts the Jira ticket'
 
     @classmethod
@@ -1189,7 +1270,6 @@ class Abort():
         print BOLD("DONE")
 
 class NotifyBugs():
-    METHOD = 'notify-bugs'
     DOC = 'Sends a Hipchat notification to all who have blocker bugs assigned to them waiting in ToDo'
 
     @classmethod
@@ -1232,11 +1312,7 @@ def notify_hipchat_cr(msg, issue):
 
 def lobo_entry():
 
-    parser = ToolkitBase( [WorkOn, NewFeature, Commit, Daily, Submit, PreLand, Land, Backout, Freeze, ApproveCR,
-                           ApproveQA, CherryPick, Test, Info, Reopen, RejectCR, CheckConfig, Update,
-                           ApproveUITests, Sync, Release, ShowOpenIssues, PostBuildForPreLand, PostBuildForSubmit,
-                           configuration.SetEnv, configuration.Config, configuration.GetConfig,
-                           UpdateQA, Abort, NotifyBugs] )
+    parser = ToolkitBase(command_registry.LOBO)
     started = time.time()
     parser.parse()
     elapsed = time.time() - started
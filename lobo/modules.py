@@ -1,11 +1,14 @@
-import yaml
+import os
 
 __author__ = 'rotem'
 
 
 def load_modules_config():
+    import yaml
+    # lobo runs from the project root, while the first lookup may well happen inside a submodule
+    from journal import START_DIR
     try:
-        with open(".lobomodules", 'r') as stream:
+        with open(os.path.join(START_DIR, ".lobomodules"), 'r') as stream:
             modules = yaml.load(stream)
     except (IOError, yaml.scanner.ScannerError):
         modules = dict()
@@ -18,10 +21,13 @@ def load_modules_config():
 
 def is_module_excluded(module_name):
     global modules
+    if modules is None:
+        modules = load_modules_config()
     stripped = module_name.strip("./")
     if not modules.has_key("exclude"):
         return False
     return stripped in modules["exclude"]
 
 
-modules = load_modules_config()
+# .lobomodules is read by the first command that needs it
+modules = None
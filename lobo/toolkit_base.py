@@ -1,19 +1,69 @@
+import os
 import sys
 import argparse
+import importlib
+from collections import OrderedDict
+
+import tracing
+
+
+def load_command(path):
+    """
+    :param path: 'module:attribute', the attribute may be dotted
+    """
+    module, _, attributes = path.partition(':')
+    command = importlib.import_module(module)
+    for attribute in attributes.split('.'):
+        command = getattr(command, attribute)
+    return command
 
 
 class ToolkitBase(object):
     def __init__(self, commands):
+        """
+        :param commands: (name, command) pairs, a command is its class or the 'module:attribute' it's imported from
+            only when it's run
+        """
+        self.commands = OrderedDict(commands)
         self.argparser = argparse.ArgumentParser(sys.argv[0])
+        self.add_global_arguments(self.argparser)
         self.command_map = {}
-        subparsers = self.argparser.add_subparsers(title="command", help='command to use', dest='_command')
+        self.subparsers = self.argparser.add_subparsers(title="command", help='command to use', dest='_command')
+
+    @staticmethod
+    def add_global_arguments(parser):
+        parser.add_argument("--trace", help="save a chrome trace of the command to this file "
+                                            "(or set %s)" % tracing.TRACE_ENV,
+                            default=os.environ.get(tracing.TRACE_ENV), dest='_trace')
+
+    def add_command(self, name):
+        cmd = self.commands[name]
+        if isinstance(cmd, basestring):
+            cmd = load_command(cmd)
+        self.command_map[name] = cmd
+        cmd_parser = self.subparsers.add_parser(name, help=cmd.DOC)
+        cmd.setup_argparser(cmd_parser)
 
-        for cmd in commands:
-            self.command_map[cmd.METHOD] = cmd
-            cmd_parser = subparsers.add_parser(cmd.METHOD, help=cmd.DOC)
-            cmd.setup_argparser(cmd_parser)
+    def chosen_command(self, args):
+        """
+        The command named on the command line, None when there isn't one we know (e.g. --help)
+        """
+        parser = argparse.ArgumentParser(add_help=False)
+        self.add_global_arguments(parser)
+        _, rest = parser.parse_known_args(args)
+        for arg in rest:
+            if not arg.startswith('-'):
+                return arg if arg in self.commands else None
+        return None
 
-    def parse(self):
-        namespace = self.argparser.parse_args()
+    def parse(self, args=None):
+        name = self.chosen_command(args)
+        # without a command, help and usage errors list them all
+        for cmd in [name] if name is not None else self.commands:
+            self.add_command(cmd)
+        namespace = self.argparser.parse_args(args)
+        if namespace._trace:
+            tracing.tracer.start(namespace._trace)
         cmd = self.command_map[namespace._command]
-        cmd().handle(namespace)
+        with tracing.span(namespace._command, 'command'):
+            cmd().handle(namespace)
@@ -0,0 +1,86 @@
+import atexit
+import json
+import os
+import threading
+import time
+import urlparse
+from contextlib import contextmanager
+
+"""
+Nested timing spans for lobo commands, saved as Chrome trace events (load the file in chrome://tracing).
+Enabled by `--trace FILE` or the LOBO_TRACE environment variable, spans cost nothing otherwise
+"""
+
+TRACE_ENV = 'LOBO_TRACE'
+
+
+class Tracer(object):
+    def __init__(self):
+        self.filename = None
+        self.events = []
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.filename is not None
+
+    def start(self, filename):
+        if self.enabled:
+            return
+        self.filename = filename
+        trace_http_requests()
+        atexit.register(self.save)
+
+    @contextmanager
+    def span(self, name, category='lobo', **args):
+        if not self.enabled:
+            yield
+            return
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, category, started, time.time() - started, args)
+
+    def add(self, name, category, started, duration, args):
+        thread = threading.current_thread()
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread.ident,
+                 'ts': int(started * 1e6), 'dur': int(duration * 1e6), 'args': args}
+        with self.lock:
+            if thread.ident not in self.threads:
+                self.threads.add(thread.ident)
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread.ident,
+                                    'args': {'name': thread.name}})
+            self.events.append(event)
+
+    def save(self):
+        with self.lock:
+            events = list(self.events)
+        with open(self.filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def trace_http_requests():
+    """
+    The jira, gitlab, jenkins and hipchat clients all talk HTTP through requests, so one hook covers them all
+    """
+    try:
+        import requests
+    except ImportError:
+        return
+    request = requests.Session.request
+    if getattr(request, 'traced', False):
+        return
+
+    def traced_request(session, method, url, *args, **kwargs):
+        parts = urlparse.urlparse(url)
+        with tracer.span('%s %s%s' % (method, parts.netloc, parts.path), 'http', url=url):
+            return request(session, method, url, *args, **kwargs)
+
+    traced_request.traced = True
+    requests.Session.request = traced_request
+
+
+tracer = Tracer()
+span = tracer.span
@@ -1,5 +1,6 @@
 import re
 import sys
+import command_registry
 from toolkit_base import ToolkitBase
 
 __author__ = 'rotem'
@@ -29,7 +30,6 @@ SCREEN_VARIANTS = {
 
 
 class CalcVersionName(object):
-    METHOD = "c2n"
     DOC = "Calculate version name from version code"
 
 
@@ -50,7 +50,6 @@ class CalcVersionName(object):
 
 
 class CalcVersionCode(object):
-    METHOD = "n2c"
     DOC = "Calculate version code from version name"
 
     @classmethod
@@ -198,7 +197,7 @@ class ScreenAbiDensitySplitsVersion():
 
 
 def version_tool_entry():
-    parser = ToolkitBase([CalcVersionName, CalcVersionCode])
+    parser = ToolkitBase(command_registry.VERSION)
     parser.parse()
 
 
@@ -26,7 +26,8 @@ setup(
             'lobo-builder = lobo:builder_tool_entry',
             'lobo-im = lobo:im_tool_entry',
             'lobo-version = lobo:version_tool_entry',
-            'lobo = lobo:lobo_entry',
+            'lobo = lobo:lobo_client_entry',
+            'lobo-daemon = lobo:daemon_entry',
         ]
     },
 )
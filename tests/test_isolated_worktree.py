@@ -0,0 +1,58 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lobo'))
+
+import git_tool
+
+
+def git(cwd, *args):
+    subprocess.check_call(['git', '-c', 'protocol.file.allow=always'] + list(args), cwd=cwd,
+                          stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+
+
+class IsolatedWorktreeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.env = dict(os.environ)
+        os.environ.update(GIT_AUTHOR_NAME='lobo', GIT_AUTHOR_EMAIL='lobo@example.com',
+                          GIT_COMMITTER_NAME='lobo', GIT_COMMITTER_EMAIL='lobo@example.com')
+        sub = os.path.join(self.tmp, 'sub')
+        self.top = os.path.join(self.tmp, 'top')
+        for path in (sub, self.top):
+            os.mkdir(path)
+            git(path, 'init', '-q')
+            git(path, 'commit', '-q', '--allow-empty', '-m', 'init')
+        git(self.top, 'submodule', 'add', '-q', sub, 'sub')
+        git(self.top, 'commit', '-q', '-m', 'add sub')
+        self.cwd = os.getcwd()
+        os.chdir(self.top)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        for service in git_tool.object_services.values():
+            for p in service.processes.values():
+                p.stdin.close()
+                p.wait()
+        git_tool.object_services.clear()
+        os.environ.clear()
+        os.environ.update(self.env)
+        shutil.rmtree(self.tmp)
+
+    def test_slot_reused_by_the_next_run(self):
+        worktree = git_tool.IsolatedWorktree(self.top)
+        slots = []
+        for _ in range(2):
+            with worktree('HEAD') as slot:
+                # starts the long lived cat-file while the slot is locked
+                git_tool.get_object_service().rev_parse('HEAD')
+                slots.append(os.path.basename(slot))
+        self.assertEqual(slots, ['slot-0', 'slot-0'])
+
+
+if __name__ == '__main__':
+    unittest.main()